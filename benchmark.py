@@ -0,0 +1,317 @@
+'''
+Author: Kyle Charters
+
+Description:
+    The benchmark module times the renderers over fixed camera paths and saves the results as json
+
+Contents:
+    - cameraPath()
+    - editorPath()
+    - syntheticLevel()
+    - summarize()
+    - timeFrames()
+    - benchmark3D()
+    - benchmark2D()
+    - benchmarkEditor()
+    - runBenchmarks()
+    - start()
+
+Notes:
+    Every case renders the same frames every run, camera paths and synthetic levels only depend on the level and seed
+    
+    render3D is timed at every resolution and render quality option in the setting module, render2D at every
+    resolution and the map editor once, because its viewport has a fixed size
+    
+    Every level is rendered with every pack, frame times are reported in milliseconds
+    
+    Usage:
+        python3 benchmark.py --output benchmark.json
+        python3 benchmark.py --frames 30 --packs Dungeon --renderers render3D --no-synthetic
+'''
+
+import os
+import time
+import random
+
+def cameraPath(level, frames):
+    '''
+    Description:
+        Creates camera poses that visit the empty tiles of a level while turning around twice
+    
+    Parameters:
+        level: The level to create a path through
+        frames: The amount of poses
+    
+    Returns:
+        A list of poses (x, y, direction)
+    '''
+    
+    empty = [(x, y) for y in range(level.getHeight()) for x in range(level.getWidth()) if level.getElement(x, y) == 0]
+    if not empty:
+        empty = [(int(level.player.x), int(level.player.y))]
+    
+    poses = []
+    for frame in range(frames):
+        x, y = empty[frame * len(empty) // frames]
+        poses.append((x + 0.5, y + 0.5, (frame * 720 / frames) % 360))
+    return poses
+
+def editorPath(level, frames):
+    '''
+    Description:
+        Creates map editor cameras that pan diagonally across a level at a few zoom levels
+    
+    Parameters:
+        level: The level to create a path over
+        frames: The amount of cameras
+    
+    Returns:
+        A list of cameras (x, y, scale)
+    '''
+    
+    scales = (0.25, 0.5, 1, 2)
+    
+    cameras = []
+    for frame in range(frames):
+        progress = frame / max(1, frames - 1)
+        cameras.append((progress * level.getWidth(), progress * level.getHeight(), scales[frame % len(scales)]))
+    return cameras
+
+def syntheticLevel(size, sprites, enemies, seed=0):
+    '''
+    Description:
+        Creates a square level with scattered walls and many sprites
+    
+    Parameters:
+        size: The width and height of the level
+        sprites: The amount of statics
+        enemies: The amount of enemies
+        seed: The random seed, the same seed always gives the same level
+    
+    Returns:
+        A level object
+    '''
+    
+    import world
+    
+    generator = random.Random(seed)
+    
+    level = world.Level()
+    level.name = "Synthetic %d sprites %d enemies" % (sprites, enemies)
+    level.loadEmpty(size, size)
+    
+    #Walls around the border and a few pillars inside
+    for x in range(size):
+        for y in range(size):
+            if x in (0, size - 1) or y in (0, size - 1) or generator.random() < 0.06:
+                level.setElement(x, y, generator.randint(1, 2))
+    
+    empty = [(x, y) for y in range(size) for x in range(size) if level.getElement(x, y) == 0]
+    
+    for count in range(sprites):
+        x, y = generator.choice(empty)
+        level.addEntity(world.Static(x + generator.random(), y + generator.random(), generator.randint(1, 3)))
+    
+    for count in range(enemies):
+        x, y = generator.choice(empty)
+        level.addEntity(world.Enemy(x + 0.5, y + 0.5, generator.randint(0, 359), 1, 1.5, 100, 3, 10, 13, 2))
+    
+    x, y = empty[0]
+    level.player.x = x + 0.5
+    level.player.y = y + 0.5
+    return level
+
+def summarize(times):
+    '''
+    Description:
+        Summarizes frame times
+    
+    Parameters:
+        times: A list of frame times in seconds
+    
+    Returns:
+        A dictionary of statistics in milliseconds
+    '''
+    
+    import numpy
+    
+    milliseconds = numpy.array(times) * 1000
+    p50, p90, p95, p99 = numpy.percentile(milliseconds, (50, 90, 95, 99))
+    
+    return {"frames": len(times),
+            "mean": float(milliseconds.mean()),
+            "min": float(milliseconds.min()),
+            "p50": float(p50),
+            "p90": float(p90),
+            "p95": float(p95),
+            "p99": float(p99),
+            "max": float(milliseconds.max())}
+
+def timeFrames(draw, cameras, warmup=2):
+    '''
+    Description:
+        Times a draw function once for every camera
+    
+    Parameters:
+        draw: A function that renders a single frame, called as draw(camera)
+        cameras: The cameras to render
+        warmup: The amount of frames rendered before timing, so caches are filled like in a running game
+    
+    Returns:
+        A dictionary of statistics, see summarize()
+    '''
+    
+    for camera in cameras[:warmup]:
+        draw(camera)
+    
+    times = []
+    for camera in cameras:
+        start = time.perf_counter()
+        draw(camera)
+        times.append(time.perf_counter() - start)
+    
+    return summarize(times)
+
+def benchmark3D(level, resolution, quality, frames, bands=1, threads=1):
+    import pygame
+    import graphic
+    from constants import G_FOV
+    
+    surface = pygame.Surface(resolution)
+    
+    def draw(camera):
+        level.player.x, level.player.y, level.player.direction = camera
+        graphic.render3D(surface, level, G_FOV, quality, bands, threads)
+    
+    return timeFrames(draw, cameraPath(level, frames))
+
+def benchmark2D(level, resolution, frames):
+    import pygame
+    import graphic
+    import file
+    
+    surface = pygame.Surface(resolution)
+    playerimage = file.loadImage("core/tex/player.png")
+    #Same minimap rectangle as in the play state
+    rect = (int(resolution[0] / 2 - 176), int(resolution[1] / 2 - 176), 352, 352)
+    
+    def draw(camera):
+        level.player.x, level.player.y, level.player.direction = camera
+        graphic.render2D(surface, rect, level, 0.5, playerimage)
+    
+    return timeFrames(draw, cameraPath(level, frames))
+
+def benchmarkEditor(level, frames):
+    import pygame
+    import editor
+    
+    surface = pygame.Surface((640, 480))
+    #Same viewport as in the editor state
+    mapeditor = editor.MapEditor((0, 50, 530, 445), level)
+    
+    def draw(camera):
+        mapeditor.x, mapeditor.y, scale = camera
+        mapeditor.zoom(scale - mapeditor.scale)
+        mapeditor.render(surface)
+    
+    return timeFrames(draw, editorPath(level, frames))
+
+def runBenchmarks(levels, packs, renderers=("render3D", "render2D", "editor"), frames=60, bands=1, threads=1, log=None):
+    '''
+    Description:
+        Runs every benchmark case
+    
+    Parameters:
+        levels: A list of (name, level) tuples
+        packs: A list of pack names, every level is rendered with every pack
+        renderers: The renderers to time, any of "render3D", "render2D" and "editor"
+        frames: The amount of frames timed in every case
+        bands: The amount of bands render3D splits frames into
+        threads: The amount of threads render3D uses
+        log: A function called with every finished case, used for progress
+    
+    Returns:
+        A list of dictionaries, one for every case
+    '''
+    
+    import setting
+    
+    results = []
+    
+    def record(case, stats):
+        case.update(stats)
+        results.append(case)
+        if log is not None:
+            log(case)
+    
+    for packname in packs:
+        for levelname, level in levels:
+            level.setPack(packname)
+            case = {"level": levelname, "pack": packname}
+            
+            if "render3D" in renderers:
+                for resolution in setting.resolutionoptions:
+                    for quality in setting.renderqualityoptions:
+                        record(dict(case, renderer="render3D", resolution=resolution, quality=quality, bands=bands, threads=threads), benchmark3D(level, resolution, quality, frames, bands, threads))
+            
+            if "render2D" in renderers:
+                for resolution in setting.resolutionoptions:
+                    record(dict(case, renderer="render2D", resolution=resolution), benchmark2D(level, resolution, frames))
+            
+            if "editor" in renderers:
+                record(dict(case, renderer="editor"), benchmarkEditor(level, frames))
+    
+    return results
+
+def start(arguments=None):
+    import argparse
+    import json
+    import platform
+    
+    parser = argparse.ArgumentParser(description="Time the renderers and save the results as json")
+    parser.add_argument("--levels", nargs="*", default=None, help="level files to render, defaults to every level in the levels folder")
+    parser.add_argument("--packs", nargs="*", default=["Dungeon", "Wolfenstein"], help="packs to render every level with")
+    parser.add_argument("--renderers", nargs="*", choices=("render3D", "render2D", "editor"), default=["render3D", "render2D", "editor"])
+    parser.add_argument("--frames", type=int, default=60, help="the amount of frames timed in every case")
+    parser.add_argument("--bands", type=int, default=1, help="the amount of bands render3D splits frames into")
+    parser.add_argument("--threads", type=int, default=1, help="the amount of threads render3D uses")
+    parser.add_argument("--no-synthetic", dest="synthetic", action="store_false", help="skip the synthetic sprite heavy levels")
+    parser.add_argument("--seed", type=int, default=0, help="the random seed used for synthetic levels")
+    parser.add_argument("--output", default="benchmark.json", help="the json file to save results in")
+    arguments = parser.parse_args(arguments)
+    
+    import headless
+    headless.initialize()
+    
+    import pygame
+    import numpy
+    import world
+    
+    paths = arguments.levels
+    if paths is None:
+        paths = sorted(os.path.join("levels", name) for name in os.listdir("levels") if name.endswith(".level"))
+    
+    levels = [(os.path.split(path)[1], world.Level(path)) for path in paths]
+    if arguments.synthetic:
+        levels.append(("synthetic-200", syntheticLevel(32, 180, 20, arguments.seed)))
+        levels.append(("synthetic-1000", syntheticLevel(48, 900, 100, arguments.seed)))
+    
+    def log(case):
+        print("%-10s %-16s %-12s %-12s %-8s %8.2f ms p50 %8.2f ms p99" % (case['renderer'], case['level'], case['pack'], "x".join(map(str, case.get('resolution', ()))), case.get('quality', ""), case['p50'], case['p99']))
+    
+    results = runBenchmarks(levels, arguments.packs, arguments.renderers, arguments.frames, arguments.bands, arguments.threads, log)
+    
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "python": platform.python_version(),
+              "pygame": pygame.version.ver,
+              "numpy": numpy.__version__,
+              "machine": platform.machine(),
+              "cpus": os.cpu_count(),
+              "frames": arguments.frames,
+              "results": results}
+    
+    with open(arguments.output, 'w') as output:
+        json.dump(report, output, indent=1)
+
+if __name__ == "__main__":
+    start()
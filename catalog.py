@@ -0,0 +1,110 @@
+'''
+Author: Kyle Charters
+
+Description:
+    The catalog module keeps an index of level metadata, so levels do not have to be loaded to be listed
+
+Contents:
+    - Catalog
+    - readMetadata()
+
+Notes:
+    The index is saved as json in the level folder, entries are keyed by file name and only read again when the
+    modification time or size of their file changes
+    
+    Binary levels only need their header read, json levels are parsed once when they change
+'''
+
+import os
+import json
+import file
+
+class Catalog(object):
+    def __init__(self, folder="levels/", index=".catalog"):
+        '''
+        Description:
+            An index of the levels in a folder
+        
+        Parameters:
+            folder: The folder with the levels, must end with a slash
+            index: The name of the index file inside the folder
+        
+        Notes:
+            Call update() to bring the index up to date with the folder
+        '''
+        
+        self.folder = folder
+        self.path = folder + index
+        self.entries = {}
+        
+        #A missing or broken index is rebuilt
+        try:
+            with open(self.path, 'r') as index:
+                self.entries = json.load(index)
+        except (OSError, ValueError):
+            self.entries = {}
+    
+    def update(self):
+        '''
+        Description:
+            Reads the metadata of new and changed levels, forgets removed levels and saves the index if anything changed
+        
+        Returns:
+            A list of metadata dictionaries sorted by file name, see readMetadata()
+        '''
+        
+        changed = False
+        found = {}
+        
+        for fileName in sorted(file.listContents(self.folder)):
+            path = self.folder + fileName
+            if not fileName.endswith(".level") or not os.path.isfile(path):
+                continue
+            
+            stat = os.stat(path)
+            entry = self.entries.get(fileName)
+            if entry is None or entry['mtime'] != stat.st_mtime_ns or entry['bytes'] != stat.st_size:
+                try:
+                    entry = readMetadata(path)
+                except (OSError, ValueError, KeyError, IndexError, TypeError):
+                    #Broken levels are left out
+                    continue
+                entry.update({"file": fileName, "mtime": stat.st_mtime_ns, "bytes": stat.st_size})
+                changed = True
+            found[fileName] = entry
+        
+        if changed or len(found) != len(self.entries):
+            self.entries = found
+            try:
+                with open(self.path, 'w') as index:
+                    json.dump(self.entries, index)
+            except OSError:
+                #The index is only a cache, levels are still listed without it
+                pass
+        
+        return [self.entries[fileName] for fileName in sorted(self.entries)]
+    
+    def getPath(self, entry):
+        #Path of the level an entry describes
+        return self.folder + entry['file']
+
+def readMetadata(path):
+    '''
+    Description:
+        Reads the metadata of a level file
+    
+    Parameters:
+        path: The path of the level
+    
+    Returns:
+        A dictionary with the name, width, height, pack and the amount of statics, items and enemies
+    '''
+    
+    if file.isBinaryLevel(path):
+        header, _ = file.loadBinaryLevelHeader(path)
+        return {"name": header['name'], "width": header['width'], "height": header['height'], "pack": header['pack'],
+                "statics": header['statics'], "items": header['items'], "enemies": header['enemies']}
+    
+    data = file.loadJson(path)
+    return {"name": data['name'], "width": len(data['map'][0]), "height": len(data['map']), "pack": data['pack'],
+            "statics": len(data['statics']), "items": len(data['items']), "enemies": len(data['enemies'])}
@@ -0,0 +1,349 @@
+'''
+Author: Kyle Charters
+
+Description:
+    The columns module stores enemies and projectiles in numpy arrays so a level can update all of them at once
+
+Contents:
+    - Table
+    - Columns
+    - EnemyView
+    - ProjectileView
+    - column()
+    - getTiles()
+    - moveRows()
+
+Notes:
+    A level only uses columns after Level.useColumns() is called, see W_COLUMNTHRESHOLD
+    
+    Entities stay the same objects, their class is switched to a view class whose fields read and write a row of
+    the arrays, so the editor, renderers and saving keep working without changes
+    
+    Batched updates follow Enemy.update and Projectile.update, except that a projectile that touches more than one
+    enemy damages the first one in the table instead of the first one in the spatial index
+'''
+
+from constants import W_WALLDIST
+import math
+import numpy
+import world
+
+class Table(object):
+    def __init__(self, fields):
+        '''
+        Description:
+            A table stores fields of entities in one numpy array per field, every entity has a row
+        
+        Parameters:
+            fields: A list of (name, dtype) tuples
+        
+        Notes:
+            Removing a row moves the last row into its place, so rows are not in any particular order
+        '''
+        
+        self.size = 0
+        self.capacity = 16
+        self.arrays = {name: numpy.zeros(self.capacity, dtype) for name, dtype in fields}
+        #Entity stored in every row
+        self.entities = []
+    
+    def add(self, entity):
+        #Grow all arrays together when full
+        if self.size == self.capacity:
+            self.capacity *= 2
+            for name, array in self.arrays.items():
+                grown = numpy.zeros(self.capacity, array.dtype)
+                grown[:self.size] = array[:self.size]
+                self.arrays[name] = grown
+        
+        self.entities.append(entity)
+        self.size += 1
+        return self.size - 1
+    
+    def remove(self, row):
+        last = self.size - 1
+        if row != last:
+            #Move the last row into the removed row
+            for array in self.arrays.values():
+                array[row] = array[last]
+            moved = self.entities[last]
+            moved.row = row
+            self.entities[row] = moved
+        
+        self.entities.pop()
+        self.size -= 1
+    
+    def get(self, name):
+        #Array of a field for every stored entity, writing to it changes the entities
+        return self.arrays[name][:self.size]
+
+def column(name, convert):
+    #Property that reads and writes an entity's row in its table
+    return property(lambda self: convert(self.table.arrays[name][self.row]),
+                    lambda self, value: self.table.arrays[name].__setitem__(self.row, value))
+
+class EnemyView(world.Enemy):
+    #No slots of its own, the class of an entity can only be switched between classes with the same slots
+    __slots__ = ()
+    fields = ("x", "y", "lastx", "lasty", "direction", "speed", "health", "dead", "cooldown", "cooldowntime")
+    
+    x = column("x", float)
+    y = column("y", float)
+    lastx = column("lastx", float)
+    lasty = column("lasty", float)
+    direction = column("direction", float)
+    speed = column("speed", float)
+    health = column("health", float)
+    dead = column("dead", bool)
+    cooldown = column("cooldown", float)
+    cooldowntime = column("cooldowntime", float)
+
+class ProjectileView(world.Projectile):
+    __slots__ = ()
+    fields = ("x", "y", "lastx", "lasty", "direction", "speed", "damage")
+    
+    x = column("x", float)
+    y = column("y", float)
+    lastx = column("lastx", float)
+    lasty = column("lasty", float)
+    direction = column("direction", float)
+    speed = column("speed", float)
+    damage = column("damage", float)
+
+class Columns(object):
+    def __init__(self):
+        '''
+        Description:
+            Stores the enemies and projectiles of a level in tables and updates them all at once
+        
+        Notes:
+            Enemies also get a unique id, projectiles store the id of the entity that shot them, the player is 0
+            
+            Enemies remember the tile they last checked line of sight to the player from, and the result
+        '''
+        
+        self.enemies = Table([(name, bool if name == "dead" else float) for name in EnemyView.fields] + [("uid", int), ("sighttile", int), ("sight", bool)])
+        self.projectiles = Table([(name, float) for name in ProjectileView.fields] + [("spawn", int)])
+        self.uids = 0
+        #Player tile and map revision the enemies' line of sight was checked for
+        self.sightkey = None
+    
+    def insert(self, entity):
+        if entity.variation == 2:
+            table, view = self.enemies, EnemyView
+        elif entity.variation == 3:
+            table, view = self.projectiles, ProjectileView
+        else:
+            return
+        
+        values = [getattr(entity, name) for name in view.fields]
+        
+        entity.table = table
+        entity.row = table.add(entity)
+        entity.__class__ = view
+        for name, value in zip(view.fields, values):
+            setattr(entity, name, value)
+        
+        if view is EnemyView:
+            self.uids += 1
+            table.arrays["uid"][entity.row] = self.uids
+            table.arrays["sighttile"][entity.row] = -1
+        else:
+            table.arrays["spawn"][entity.row] = self.getUid(entity.spawn)
+    
+    def release(self, entity):
+        #Moves an entity's fields out of the arrays and back onto the entity
+        if entity.table is self.enemies or entity.table is self.projectiles:
+            view = entity.__class__
+            values = [getattr(entity, name) for name in view.fields]
+            
+            entity.table.remove(entity.row)
+            entity.table = None
+            entity.row = None
+            entity.__class__ = view.__bases__[0]
+            for name, value in zip(view.fields, values):
+                setattr(entity, name, value)
+    
+    def getUid(self, entity):
+        if isinstance(entity, world.Player):
+            return 0
+        if entity.table is self.enemies:
+            return self.enemies.arrays["uid"][entity.row]
+        #Entities that are not stored never match
+        return -1
+    
+    def remember(self):
+        for table in (self.enemies, self.projectiles):
+            table.get("lastx")[:] = table.get("x")
+            table.get("lasty")[:] = table.get("y")
+    
+    def update(self, level, delta):
+        self.updateEnemies(level, delta)
+        self.updateProjectiles(level, delta)
+    
+    def updateEnemies(self, level, delta):
+        '''
+        Description:
+            Updates every enemy like Enemy.update
+        
+        Parameters:
+            level: The level the enemies are in
+            delta: The time since the last update in seconds
+        '''
+        
+        table = self.enemies
+        table.get("cooldowntime")[:] += delta
+        
+        #Enemies that died during the last update are removed
+        for enemy in [table.entities[row] for row in numpy.flatnonzero(table.get("dead"))]:
+            level.removeEntity(enemy)
+        
+        if table.size == 0:
+            return
+        
+        x, y, direction = table.get("x"), table.get("y"), table.get("direction")
+        player = level.player
+        
+        #Turn towards the way to the player, at most 10 degrees at a time
+        direction[:] = (direction + numpy.minimum(10, level.getFlowAngles(x, y) - direction)) % 360
+        
+        #Walk if the player is close, but not too close
+        distance = numpy.sqrt((x - player.x) ** 2 + (y - player.y) ** 2)
+        rows = numpy.flatnonzero((distance >= 4) & (distance < 12))
+        if rows.size:
+            angle = numpy.radians(direction[rows])
+            step = table.get("speed")[rows] * delta
+            moveRows(level, table, rows, numpy.cos(angle) * step, numpy.sin(angle) * step)
+        
+        #Shoot at the player when the cooldown is over and the player can be seen
+        cooldowntime = table.get("cooldowntime")
+        ready = numpy.flatnonzero(cooldowntime > table.get("cooldown"))
+        if ready.size:
+            #Enemies that can not see the player stay ready, so line of sight is only checked again after a tile change
+            key = (math.floor(player.x), math.floor(player.y), level.revision)
+            sighttile, sight = table.get("sighttile"), table.get("sight")
+            if key != self.sightkey:
+                self.sightkey = key
+                sighttile[:] = -1
+            
+            tiles = numpy.floor(y[ready]).astype(int) * 65536 + numpy.floor(x[ready]).astype(int)
+            for row in ready[sighttile[ready] != tiles]:
+                sight[row] = level.canSee(x[row], y[row], player.x, player.y)
+            sighttile[ready] = tiles
+            
+            for row in ready[sight[ready]]:
+                cooldowntime[row] = 0
+                direction[row] = math.degrees(math.atan2(player.y - y[row], player.x - x[row])) % 360
+                enemy = table.entities[row]
+                level.spawnProjectile(float(x[row]), float(y[row]), float(direction[row]), enemy.projectiletexture, enemy)
+    
+    def updateProjectiles(self, level, delta):
+        '''
+        Description:
+            Updates every projectile like Projectile.update
+        
+        Parameters:
+            level: The level the projectiles are in
+            delta: The time since the last update in seconds
+        '''
+        
+        table = self.projectiles
+        if table.size == 0:
+            return
+        
+        x, y, damage, spawn = table.get("x"), table.get("y"), table.get("damage"), table.get("spawn")
+        angle = numpy.radians(table.get("direction"))
+        step = table.get("speed") * delta
+        moveRows(level, table, numpy.arange(table.size), numpy.cos(angle) * step, numpy.sin(angle) * step, False)
+        
+        #Projectiles are removed when they fly into a wall
+        wall = getTiles(level, x, y) != 0
+        
+        #Or when they hit the player, unless the player shot them
+        player = level.player
+        hitplayer = ~wall & (spawn != 0) & (x - 0.5 <= player.x) & (player.x <= x + 0.5) & (y - 0.5 <= player.y) & (player.y <= y + 0.5)
+        if hitplayer.any():
+            player.damage(float(damage[hitplayer].sum()))
+        
+        #Or when they hit an enemy that did not shoot them, checked as a projectile by enemy matrix
+        hit = wall | hitplayer
+        enemies = self.enemies
+        if enemies.size:
+            rows = numpy.flatnonzero(~hit)
+            ex, ey = enemies.get("x"), enemies.get("y")
+            touching = ((ex - 0.5 <= x[rows, None]) & (x[rows, None] <= ex + 0.5) &
+                        (ey - 0.5 <= y[rows, None]) & (y[rows, None] <= ey + 0.5) &
+                        (enemies.get("uid") != spawn[rows, None]))
+            hitenemy = touching.any(1)
+            
+            if hitenemy.any():
+                #Every projectile damages the first enemy it touches
+                total = numpy.zeros(enemies.size)
+                numpy.add.at(total, touching[hitenemy].argmax(1), damage[rows[hitenemy]])
+                hit[rows[hitenemy]] = True
+                
+                health, dead = enemies.get("health"), enemies.get("dead")
+                struck = total > 0
+                killed = struck & (health - total <= 0)
+                health[struck & ~killed] -= total[struck & ~killed]
+                health[killed] = 0
+                dead[killed] = True
+        
+        for projectile in [table.entities[row] for row in numpy.flatnonzero(hit)]:
+            level.removeEntity(projectile)
+
+def getTiles(level, x, y):
+    #Tiles at many positions, positions outside the map are the outer wall
+    grid = level.getGrid()
+    cellX = numpy.floor(x).astype(int)
+    cellY = numpy.floor(y).astype(int)
+    inside = (cellX >= 0) & (cellX < grid.shape[1]) & (cellY >= 0) & (cellY < grid.shape[0])
+    
+    tiles = numpy.full(cellX.shape, level.outerwall, grid.dtype)
+    tiles[inside] = grid[cellY[inside], cellX[inside]]
+    return tiles
+
+def moveRows(level, table, rows, deltaX, deltaY, collision=True, legdist=W_WALLDIST):
+    '''
+    Description:
+        Moves many rows of a table at once, like Entity.move with fast collision
+    
+    Parameters:
+        level: The level the entities are in
+        table: The table of the entities
+        rows: The rows to move
+        deltaX: Amount to move every row on the x-axis
+        deltaY: Amount to move every row on the y-axis
+        collision: Considers collision
+        legdist: Closest distance the entities can get to the wall
+    
+    Notes:
+        Entities that move to a different tile are moved in the level's spatial index
+    '''
+    
+    x, y = table.get("x"), table.get("y")
+    oldX, oldY = x[rows], y[rows]
+    newX, newY = oldX.copy(), oldY.copy()
+    
+    if collision:
+        #Checks to see if the x movement is inside wall
+        offset = numpy.copysign(legdist, deltaX) + deltaX
+        free = (getTiles(level, newX + offset, newY + legdist) == 0) & (getTiles(level, newX + offset, newY - legdist) == 0)
+        newX[free] += deltaX[free]
+        
+        #Checks to see if the y movement is inside wall
+        offset = numpy.copysign(legdist, deltaY) + deltaY
+        free = (getTiles(level, newX + legdist, newY + offset) == 0) & (getTiles(level, newX - legdist, newY + offset) == 0)
+        newY[free] += deltaY[free]
+    else:
+        newX += deltaX
+        newY += deltaY
+    
+    x[rows] = newX
+    y[rows] = newY
+    
+    #Only entities that changed tiles touch the spatial index
+    moved = rows[(numpy.floor(newX) != numpy.floor(oldX)) | (numpy.floor(newY) != numpy.floor(oldY))]
+    for entity in [table.entities[row] for row in moved]:
+        if entity.cell is not None:
+            level.relocateEntity(entity)
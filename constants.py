@@ -11,6 +11,7 @@ Contents:
     - Graphics variables
     - World variables
     - Player variables
+    - Simulation variables
 
 Notes:
     None
@@ -36,13 +37,36 @@ L_ESCAPE = KeyListener(K_ESCAPE)
 #Graphics constants
 G_TEXDIM = 64
 G_FOV = 60
+G_LIGHTLEVELS = 32
+G_LIGHTMIN = 0.2
+G_LIGHTMAX = 0.95
+G_STRIPECACHESIZE = 48 * 1024 * 1024
+#Threads that build pack textures ahead of time, see Pack.warm()
+G_WARMUPTHREADS = 4
+#Size in pixels that map layers are split into chunks of, and the most memory the chunks of a layer can use in bytes
+G_LAYERCHUNKSIZE = 256
+G_LAYERCACHESIZE = 32 * 1024 * 1024
+#Tile size in pixels below which the map editor draws walls in their average colour
+G_OVERVIEWTILESIZE = 12
 
 #World constants
 W_WALLDIST = 0.2
+#Levels with this many enemies and projectiles update them as numpy arrays
+W_COLUMNTHRESHOLD = 64
+#Amount of removed projectiles every level keeps for reuse
+W_PROJECTILEPOOL = 256
+#Distance in tiles from the player that enemies find their way in
+W_FLOWRANGE = 16
+#Amount of tile pairs every level remembers line of sight between
+W_SIGHTCACHESIZE = 65536
 
 #Player constants
 P_ROTATIONSPEED = 80
 
+#Simulation constants
+S_TIMESTEP = 1 / 120
+S_MAXSTEPS = 8
+
 
 '''
 MODULE HEADER
@@ -0,0 +1,61 @@
+'''
+Author: Kyle Charters
+
+Description:
+    The convert module converts level files between the json and binary formats
+
+Contents:
+    - convertLevel()
+    - start()
+
+Notes:
+    The format of the input file is detected, see file.isBinaryLevel()
+    
+    Usage:
+        python3 convert.py levels/Maze.level MazeBinary.level
+        python3 convert.py MazeBinary.level Maze.level --format json
+'''
+
+import file
+
+def convertLevel(source, destination, binary=None):
+    '''
+    Description:
+        Converts a level file to the other format, or to the given format
+    
+    Parameters:
+        source: The path of the level to convert
+        destination: The path to save the converted level at, can be the same as the source
+        binary: True for the binary format, False for json, None for the format the source is not in
+    
+    Returns:
+        True if the level was saved in the binary format
+    '''
+    
+    sourcebinary = file.isBinaryLevel(source)
+    if binary is None:
+        binary = not sourcebinary
+    
+    data = file.loadLevel(source)
+    if sourcebinary and not binary:
+        #Json needs lists instead of the memory mapped array
+        data['map'] = data['map'].tolist()
+    
+    file.saveLevel(destination, data, binary)
+    return binary
+
+def start(arguments=None):
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Convert levels between the json and binary formats")
+    parser.add_argument("source", help="the level file to convert")
+    parser.add_argument("destination", help="the file to save the converted level in")
+    parser.add_argument("--format", choices=("binary", "json"), default=None, help="defaults to the format the source is not in")
+    arguments = parser.parse_args(arguments)
+    
+    binary = None if arguments.format is None else arguments.format == "binary"
+    binary = convertLevel(arguments.source, arguments.destination, binary)
+    print("Saved " + arguments.destination + " as " + ("binary" if binary else "json"))
+
+if __name__ == "__main__":
+    start()
@@ -32,14 +32,16 @@ Notes:
             The tile location inside current pack
 '''
 
-from constants import G_TEXDIM
+from constants import G_TEXDIM, G_OVERVIEWTILESIZE
 import pygame
+import pygame.surfarray
+import numpy
 import easygui
 import math
 import gui
 import world
 import file
-import utility
+import graphic
 
 class PackSelector(object):
     def __init__(self, rect, font, pack, mapeditor):
@@ -101,7 +103,7 @@ class PackSelector(object):
             #Create wall text and menu
             self.wallstext = gui.AlignedLabel(self.font, "WALLS:", True, (13, 13, 13), 0, (5, y))
             y += 10
-            self.wallsmenu = gui.ImageMenu((0, y, self.rect.width, 0), 48, 4, pack.wall)
+            self.wallsmenu = gui.ImageMenu((0, y, self.rect.width, 0), 48, 4, pack.getWalls())
             y += self.wallsmenu.rect.height + 10
             self._wallsloaded = True
         
@@ -110,7 +112,7 @@ class PackSelector(object):
             #Create statics text and menu
             self.staticstext = gui.AlignedLabel(self.font, "STATICS:", True, (13, 13, 13), 0, (5, y))
             y += 10
-            self.staticsmenu = gui.ImageMenu((0, y, self.rect.width, 0), 48, 4, pack.sprite[0])
+            self.staticsmenu = gui.ImageMenu((0, y, self.rect.width, 0), 48, 4, pack.getSprites(0))
             y += self.staticsmenu.rect.height + 10
             self._staticsloaded = True
         
@@ -119,7 +121,7 @@ class PackSelector(object):
             #Create items text and menu
             self.itemstext = gui.AlignedLabel(self.font, "ITEMS:", True, (13, 13, 13), 0, (5, y))
             y += 10
-            self.itemsmenu = gui.ImageMenu((0, y, self.rect.width, 0), 48, 4, pack.sprite[1])
+            self.itemsmenu = gui.ImageMenu((0, y, self.rect.width, 0), 48, 4, pack.getSprites(1))
             y += self.itemsmenu.rect.height + 10
             self._itemsloaded = True
         
@@ -128,7 +130,7 @@ class PackSelector(object):
             #Create enemies text and menu
             self.enemiestext = gui.AlignedLabel(self.font, "ENEMIES:", True, (13, 13, 13), 0, (5, y))
             y += 10
-            self.enemiesmenu = gui.ImageMenu((0, y, self.rect.width, 0), 48, 4, pack.sprite[2])
+            self.enemiesmenu = gui.ImageMenu((0, y, self.rect.width, 0), 48, 4, pack.getSprites(2))
             y += self.enemiesmenu.rect.height + 10
             self._enemiesloaded = True
         
@@ -440,6 +442,9 @@ class MapEditor(object):
         
         self.level = level
         
+        #Cached grid and walls, drawn again when the zoom or the level changes, see render()
+        self.layer = None
+        
         self.x = self.level.getWidth() / 2
         self.y = self.level.getHeight() / 2
         self.scale = 1
@@ -501,18 +506,21 @@ class MapEditor(object):
                 
                 if self.brush[0] == 0:
                     #Push entities out of the way if they are occupying the same space
-                    for entity in self.level.getEntities():
+                    for entity in self.level.queryAABB(x + 0.5, y + 0.5, 1) + [self.level.player]:
                         if entity.collideAABB(x + 0.5, y + 0.5, 1):
                             #Math magic for finding which axis we have to move the least
                             if abs((entity.x % 1) - 0.5) > abs((entity.y % 1) - 0.5):
                                 entity.x = round(entity.x)
                             else:
                                 entity.y = round(entity.y)
-                    self.level.setElement(xfloor, yfloor, self.brush[1])
+                            self.level.relocateEntity(entity)
+                    if self.level.setElement(xfloor, yfloor, self.brush[1]) and self.layer is not None:
+                        self.layer.drawTile(xfloor, yfloor)
             
             #Erase a wall from the map
             elif self.tool == 1:
-                self.level.setElement(xfloor, yfloor, 0)
+                if self.level.setElement(xfloor, yfloor, 0) and self.layer is not None:
+                    self.layer.drawTile(xfloor, yfloor)
             
             #Add a entity to the map
             elif self.tool == 2:
@@ -556,7 +564,7 @@ class MapEditor(object):
                         if entity.variation is -1:
                             sprint = easygui.integerbox("Enter sprint speed: ", "Edit entity", entity.sprintspeed, 0, 30)
                             if sprint is not None:
-                                entity.sprint = sprint
+                                entity.sprintspeed = sprint
                         else:
                             return
                         
@@ -633,6 +641,40 @@ class MapEditor(object):
         if selected:
             self.act(mousepos, mousepress[0])
     
+    def getIcon(self, variation, texture):
+        #Sprite scaled to half a tile, the icons are kept by the tile layer of the current tile size
+        if self.layer is None or not self.layer.isCurrent(self.level, self.tilesize):
+            self.layer = graphic.TileLayer(self.level, self.tilesize, grid=True)
+        return self.layer.getIcon(variation, texture)
+    
+    def renderOverview(self, image, left, top):
+        '''
+        Description:
+            Draws the tiles inside the viewport in the average colour of their wall, one pixel per tile scaled up at once
+        
+        Parameters:
+            image: The viewport image to draw on
+            left: The x position of the top left corner of the map on the image
+            top: The y position of the top left corner of the map on the image
+        '''
+        
+        #Find the tiles inside the viewport
+        startx = max(0, -left // self.tilesize)
+        starty = max(0, -top // self.tilesize)
+        endx = min(self.level.getWidth(), -(-(image.get_width() - left) // self.tilesize))
+        endy = min(self.level.getHeight(), -(-(image.get_height() - top) // self.tilesize))
+        if startx >= endx or starty >= endy:
+            return
+        
+        #Walls that are not in the pack use the unknown texture's colour, like everywhere else
+        colors = self.level.pack.getWallColors()
+        tiles = self.level.getGrid()[starty:endy, startx:endx]
+        pixels = colors[numpy.where(tiles < len(colors), tiles, 0)]
+        pixels[tiles == 0] = self.level.floorcolor
+        
+        overview = pygame.surfarray.make_surface(pixels.transpose(1, 0, 2))
+        image.blit(pygame.transform.scale(overview, ((endx - startx) * self.tilesize, (endy - starty) * self.tilesize)), (left + startx * self.tilesize, top + starty * self.tilesize))
+    
     def render(self, surface):
         '''
         Description:
@@ -642,40 +684,36 @@ class MapEditor(object):
             surface: The surface to render to
         
         Notes:
-            None
+            The grid and tiles are drawn from a graphic.TileLayer, only the chunks inside the viewport are drawn
+            
+            Below a tile size of G_OVERVIEWTILESIZE the grid is left out and tiles are drawn in the average colour of
+            their wall instead, see renderOverview()
         '''
         image = pygame.Surface(self.rect.size)
         image.fill(self.level.floorcolor)
         
-        width = self.level.getWidth()
-        height = self.level.getHeight()
-        
-        #Render grid lines along the x-axis
-        for row in range(height + 1):
-            y = (row - self.y) * self.tilesize + self.middley
-            xstart = -self.x * self.tilesize + self.middlex
-            xend = (width - self.x) * self.tilesize + self.middlex
-            pygame.draw.line(image, (0, 0, 0), (xstart, y), (xend, y), 1)
-        
-        #Render grid lines along the y-axis
-        for col in range(width + 1):
-            x = (col - self.x) * self.tilesize + self.middlex
-            ystart = -self.y * self.tilesize + self.middley
-            yend = (height - self.y) * self.tilesize + self.middley
-            pygame.draw.line(image, (0, 0, 0), (x, ystart), (x, yend), 1)
-        
-        #Render tiles on top of grid
-        for rowposition, row in enumerate(self.level.map):
-            for colposition, tile in enumerate(row):
-                if tile != 0:
-                    x = (colposition - self.x) * self.tilesize + self.middlex + 1
-                    y = (rowposition - self.y) * self.tilesize + self.middley + 1                    
-                    image.blit(pygame.transform.scale(self.level.pack.getWall(tile), [self.tilesize - 1] * 2), (x, y))
+        left = math.floor(-self.x * self.tilesize + self.middlex)
+        top = math.floor(-self.y * self.tilesize + self.middley)
+        
+        if self.tilesize < G_OVERVIEWTILESIZE:
+            self.renderOverview(image, left, top)
+        else:
+            if self.layer is None or not self.layer.isCurrent(self.level, self.tilesize):
+                self.layer = graphic.TileLayer(self.level, self.tilesize, grid=True)
+            
+            #Render grid and tiles
+            self.layer.draw(image, left, top)
+        
+        #Render the grid lines along the bottom and right of the map, the layer does not have them
+        right = left + self.level.getWidth() * self.tilesize
+        bottom = top + self.level.getHeight() * self.tilesize
+        pygame.draw.line(image, (0, 0, 0), (left, bottom), (right, bottom), 1)
+        pygame.draw.line(image, (0, 0, 0), (right, top), (right, bottom), 1)
         
         #Render entities
         for entity in self.level.statics + self.level.items + self.level.enemies:
             #Find location of sprite as well as texture
-            texture = utility.aspect(self.level.pack.getSprite(entity.variation, entity.texture), (int(self.tilesize / 2), int(self.tilesize / 2)))
+            texture = self.getIcon(entity.variation, entity.texture)
             x = int((entity.x - self.x) * self.tilesize + self.middlex - int(texture.get_width() / 2))
             y = int((entity.y - self.y) * self.tilesize + self.middley - int(texture.get_height() / 2))
             
@@ -17,14 +17,37 @@ Contents:
     - saveString()
     - loadJson()
     - saveJson()
+    - replaceFile()
+    - isBinaryLevel()
+    - loadBinaryLevelHeader()
+    - loadBinaryLevel()
+    - saveBinaryLevel()
+    - loadLevel()
+    - saveLevel()
 
 Notes:
     Some of the methods are only wrappers for os.path methods
+    
+    Binary levels start with LEVELMAGIC, the version, and the length of a json header with everything but the map
+    and entities. The map follows as little endian uint16 tiles indexed [y, x], starting at a multiple of 16 bytes,
+    then the statics, items and enemies as packed records, see LEVELRECORDS
 '''
 
+import os
 import os.path
 import pygame.image
 import json
+import struct
+import numpy
+
+#Binary level format
+LEVELMAGIC = b"RCLV"
+LEVELVERSION = 1
+LEVELPREFIX = struct.Struct("<4sHHI")
+LEVELRECORDS = (("statics", numpy.dtype([("x", "<f8"), ("y", "<f8"), ("texture", "<i4")])),
+                ("items", numpy.dtype([("x", "<f8"), ("y", "<f8"), ("texture", "<i4"), ("function", "<i4")])),
+                ("enemies", numpy.dtype([("x", "<f8"), ("y", "<f8"), ("direction", "<f8"), ("texture", "<i4"), ("speed", "<f8"), ("health", "<f8"),
+                                         ("cooldown", "<f8"), ("projectilespeed", "<f8"), ("projectiledamage", "<f8"), ("projectiletexture", "<i4")])))
 
 def fullPath(path):
     #Get the full path from a relative path
@@ -69,7 +92,7 @@ def loadString(name):
 
 def saveString(name, data):
     #Saves a string as a file
-    open(name, 'w').write(data)
+    replaceFile(name, data)
 
 def loadJson(name):
     #Loads a file as a json dictionary
@@ -80,4 +103,86 @@ def loadJson(name):
 
 def saveJson(name, data):
     #Saves a json dictionary as a file
-    json.dump(data, open(name, 'w'))
\ No newline at end of file
+    replaceFile(name, json.dumps(data))
+
+def replaceFile(name, data):
+    #Saves a string or bytes as a file by writing a new file and then replacing the old one, so a file that is still
+    #memory mapped is never written over and a file is never left half written
+    temporary = name + "." + str(os.getpid()) + ".tmp"
+    try:
+        with open(temporary, 'wb' if isinstance(data, bytes) else 'w') as output:
+            output.write(data)
+        os.replace(temporary, name)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+def isBinaryLevel(name):
+    #Checks if a level file is in the binary format
+    if os.path.isfile(name):
+        with open(name, 'rb') as level:
+            return level.read(len(LEVELMAGIC)) == LEVELMAGIC
+    
+    return False
+
+def loadBinaryLevelHeader(name):
+    #Loads only the json header of a binary level, it has the map size and the amount of every entity, also returns where the map starts
+    with open(name, 'rb') as level:
+        magic, version, _, length = LEVELPREFIX.unpack(level.read(LEVELPREFIX.size))
+        if magic != LEVELMAGIC or version > LEVELVERSION:
+            raise ValueError("Unsupported level file: " + name)
+        return json.loads(level.read(length).decode("utf-8")), -(-(LEVELPREFIX.size + length) // 16) * 16
+
+def loadBinaryLevel(name):
+    #Loads a binary level as a dictionary, the map is memory mapped copy on write, so tiles are only read when used
+    data, offset = loadBinaryLevelHeader(name)
+    
+    width, height = data.pop('width'), data.pop('height')
+    data['map'] = numpy.memmap(name, "<u2", 'c', offset, (height, width))
+    
+    offset += width * height * 2
+    for key, dtype in LEVELRECORDS:
+        count = data.pop(key)
+        data[key] = numpy.fromfile(name, dtype, count, offset=offset).tolist()
+        offset += count * dtype.itemsize
+    
+    return data
+
+def saveBinaryLevel(name, data):
+    #Saves a level dictionary in the binary format, the map can be a list of rows or a numpy array
+    tiles = data['map']
+    if not isinstance(tiles, numpy.ndarray):
+        #Rows can be longer than the first row in older levels, those tiles are never used
+        width = len(tiles[0])
+        rows = tiles
+        tiles = numpy.zeros((len(rows), width), "<u2")
+        for y, row in enumerate(rows):
+            tiles[y, :len(row[:width])] = row[:width]
+    
+    header = {key: value for key, value in data.items() if key not in ("map", "statics", "items", "enemies")}
+    header.update({"width": tiles.shape[1], "height": tiles.shape[0]})
+    header.update({key: len(data[key]) for key, _ in LEVELRECORDS})
+    header = json.dumps(header).encode("utf-8")
+    
+    prefix = LEVELPREFIX.pack(LEVELMAGIC, LEVELVERSION, 0, len(header)) + header
+    level = [prefix, bytes(-len(prefix) % 16), numpy.ascontiguousarray(tiles, "<u2").tobytes()]
+    for key, dtype in LEVELRECORDS:
+        level.append(numpy.array([tuple(record) for record in data[key]], dtype).tobytes())
+    
+    #The old file might still be memory mapped, see replaceFile()
+    replaceFile(name, b"".join(level))
+
+def loadLevel(name):
+    #Loads a level dictionary from either format
+    if isBinaryLevel(name):
+        return loadBinaryLevel(name)
+    
+    return loadJson(name)
+
+def saveLevel(name, data, binary=False):
+    #Saves a level dictionary in either format
+    if binary:
+        saveBinaryLevel(name, data)
+    else:
+        saveJson(name, data)
@@ -6,6 +6,18 @@ Description:
 
 Contents:
     - render3D()
+    - lightLevel()
+    - lightLevels()
+    - blitWalls()
+    - rowTable()
+    - composeWalls()
+    - renderBand()
+    - getPool()
+    - castRay()
+    - castRaysReference()
+    - castRays()
+    - Panorama
+    - TileLayer
     - render2D()
     - renderHealth()
 
@@ -13,12 +25,16 @@ Notes:
     None
 '''
 
-from constants import G_TEXDIM
-from math import cos, sin, radians, sqrt
+from constants import G_TEXDIM, G_LIGHTLEVELS, G_LIGHTMIN, G_LIGHTMAX, G_LAYERCHUNKSIZE, G_LAYERCACHESIZE
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from math import cos, sin, radians, sqrt, floor, ceil, atan2, pi
 import pygame
+import pygame.surfarray
+import numpy
 import utility
 
-def render3D(surface, level, fov, linewidth):
+def render3D(surface, level, fov, linewidth, bands=1, threads=1, alpha=1):
     '''
     Description:
         Renders a pseudo 3d image from the player's perspective and direction.
@@ -27,6 +43,9 @@ def render3D(surface, level, fov, linewidth):
         level: The level used for rendering
         fov: The field of view, used for finding the direction of each ray
         linewidth: The width of each vertical stripe, this changes the amount of rays that need to be sent
+        bands: The amount of vertical bands the walls are split into
+        threads: The amount of threads the bands are rendered on
+        alpha: How far between the last two level updates to draw moving entities, see Entity.lerp()
     
     Notes:
         Order of rendering:
@@ -36,6 +55,8 @@ def render3D(surface, level, fov, linewidth):
         
         Uses a similar method to that found at:
             http://lodev.org/cgtutor/raycasting.html
+        
+        Bands give the same image no matter how many threads are used, sprites are always drawn on the calling thread
     '''
     
     #Store the width and height of the viewport
@@ -48,120 +69,55 @@ def render3D(surface, level, fov, linewidth):
     fov = fov / 90
     
     #Create the camera vectors, these are used to find out the direction of the rays to send out
-    posX = level.player.x
-    posY = level.player.y
+    posX, posY = level.player.lerp(alpha)
     dirX = cos(direction)
     dirY = sin(direction)
     plnX = -dirY * fov
     plnY = dirX * fov
     
-    #Creates an empty array to store the distances of each strip
-    distancebuffer = []
-    
     #Draw the ceiling and the floor on the top and bottom half of the viewport
     pygame.draw.rect(surface, level.ceilingcolor, pygame.Rect(0, 0, width, height / 2))
     pygame.draw.rect(surface, level.floorcolor, pygame.Rect(0, height / 2, width, height / 2))
     
-    #Iterate over every strip on the x axis
-    for x in range(0, width + 1, linewidth):
-        #Find the point on the plane vector that is equivalent to the stripe on the screen
-        camX = 2 * x / width - 1
-        rayPosX = posX
-        rayPosY = posY
-        rayDirX = dirX + (plnX * camX)
-        rayDirY = dirY + (plnY * camX)
-        
-        #Find the ray tile position
-        worldX = int(rayPosX)
-        worldY = int(rayPosY)
-        
-        #Throws errors if ray directions are 0
-        #Finds the magnitude of 
-        if rayDirX == 0: rayDirX = 0.00001
-        deltaDistX = 1 + sqrt((rayDirY ** 2) / (rayDirX ** 2))
-        if rayDirY == 0: rayDirY = 0.00001
-        deltaDistY = 1 + sqrt((rayDirX ** 2) / (rayDirY ** 2))
-        
-        #Check if the ray is moving to the right or left, this is used so that the ray only checks on grid lines
-        if rayDirX < 0:
-            stepX = -1
-            sideDistX = (rayPosX - worldX) * deltaDistX
-        else:
-            stepX = 1
-            sideDistX = (worldX + 1 - rayPosX) * deltaDistX
-        
-        #Check if the ray is moving up or down, this is used so that the ray only checks on grid lines
-        if rayDirY < 0:
-            stepY = -1
-            sideDistY = (rayPosY - worldY) * deltaDistY
-        else:
-            stepY = 1
-            sideDistY = (worldY + 1 - rayPosY) * deltaDistY
-        
-        #Update ray until it finds a wall
-        hit = False
-        while hit == False:
-            #Update ray position, only moves on one axis every update, so that it can check on grid lines
-            if sideDistX < sideDistY:
-                sideDistX += deltaDistX
-                worldX += stepX
-                side = 0
-            else:
-                sideDistY += deltaDistY
-                worldY += stepY
-                side = 1
-            
-            if level.getElement(worldX, worldY) > 0:
-                #Exit the loop if the ray hits a wall
-                hit = True
-        
-        #Don't render if the player is inside the same tile
-        if worldX == posX and worldY == posY:
-            return
-        
-        #Find the point on the wall where the ray hit. Equation changes if the ray hit the
-        #left or right side of the wall instead of the top or bottom side of the tile
-        if side == 1:
-            wallX = rayPosX + ((worldY - rayPosY + (1 - stepY) / 2) / rayDirY) * rayDirX
-        else:
-            wallX = rayPosY + ((worldX - rayPosX + (1 - stepX) / 2) / rayDirX) * rayDirY
-        wallX -= int(wallX)
+    #Find the point on the plane vector that is equivalent to every stripe on the screen
+    columns = numpy.arange(0, width + 1, linewidth)
+    camX = 2 * columns / width - 1
+    
+    rayDirX = dirX + (plnX * camX)
+    rayDirY = dirY + (plnY * camX)
+    
+    #Render the walls straight into the pixels of the surface when possible
+    if surface.get_bytesize() in (2, 4):
+        atlas = level.pack.getWallAtlas(surface)
+        pixels = pygame.surfarray.pixels2d(surface)
         
-        #Finds the distance from the player to the wall
-        if side == 0:
-            wallDistance = abs((worldX - rayPosX + (1 - stepX) / 2) / rayDirX)
+        if bands > 1 and threads > 1:
+            #Split the stripes into vertical bands, every band draws to its own columns of the surface
+            bandcolumns = numpy.array_split(numpy.arange(len(columns)), bands)
+            futures = [getPool(threads).submit(renderBand, pixels, atlas, level, posX, posY, columns[band], rayDirX[band], rayDirY[band], linewidth) for band in bandcolumns]
+            distances = numpy.concatenate([future.result() for future in futures])
         else:
-            wallDistance = abs((worldY - rayPosY + (1 - stepY) / 2) / rayDirY)
-        
-        #Calculates the height that the stripe should appear, pygame does not support values over 10000
-        lineHeight = abs(int(height / wallDistance))
-        if lineHeight > 10000: lineHeight = 10000
-        
-        #The top left corner of the stripe when it is centered on the y-axis
-        drawStart = -lineHeight / 2 + height / 2
-        
-        #Find the texture position from the wall position. This compensates for the constant G_TEXDIM
-        texX = int(wallX * G_TEXDIM)
-        if (side == 0 and rayDirX < 0) or (side == 1 and rayDirY > 0):
-            texX = G_TEXDIM - texX - 1
-        
-        tex = level.pack.getWallSplit(level.getElement(worldX, worldY))[texX]
-        
-        #Calculate a brightness for the stripe, this is based on wall distance
-        lighting = 255 * max(0.2, min(0.95, -(wallDistance / 15) + 1))
-        
-        #Render the stripe onto the screen.
-        surface.blit(utility.darkenSurface(pygame.transform.scale(tex, (linewidth, lineHeight)), lighting), (x - (linewidth / 2), drawStart))
+            distances = renderBand(pixels, atlas, level, posX, posY, columns, rayDirX, rayDirY, linewidth)
         
-        distancebuffer.append(wallDistance)
+        #Unlock the surface
+        del pixels
+    else:
+        distances, sides, walls, texXs = castRays(level, posX, posY, rayDirX, rayDirY)
+        blitWalls(surface, level, columns, distances, walls, texXs, linewidth)
+    
+    distancebuffer = distances.tolist()
     
-    #Sort entities from farthest away to closest
-    entityorder = sorted(map(lambda entity: ((posX - entity.x) ** 2 + (posY - entity.y) ** 2, entity), level.statics + level.items + level.enemies + level.projectiles), key = lambda entity: entity[0], reverse = True)
+    #Find where every entity is drawn, then sort them from farthest away to closest
+    entityorder = []
+    for entity in level.statics + level.items + level.enemies + level.projectiles:
+        entityX, entityY = entity.lerp(alpha)
+        entityorder.append(((posX - entityX) ** 2 + (posY - entityY) ** 2, entityX, entityY, entity))
+    entityorder.sort(key = lambda entity: entity[0], reverse = True)
     
     #Iterate through entities in the list
-    for entity in entityorder:
-        spriteX = entity[1].x - posX
-        spriteY = entity[1].y - posY
+    for _, entityX, entityY, entity in entityorder:
+        spriteX = entityX - posX
+        spriteY = entityY - posY
         
         #Find the depth and location of the sprite
         invDet = 1.0 / (plnX * dirY - dirX * plnY)
@@ -169,7 +125,7 @@ def render3D(surface, level, fov, linewidth):
         if spriteDepth == 0: spriteDepth = 0.00001
         spriteLocation = int((width / 2) * (1 + invDet * (dirY * spriteX - dirX * spriteY) / spriteDepth))
         
-        tex = level.pack.getSpriteSplit(entity[1].variation, entity[1].texture)
+        tex = level.pack.getSpriteSplit(entity.variation, entity.texture)
         
         #Find the sprite dimensions
         spriteDim = abs(height / spriteDepth)
@@ -177,29 +133,711 @@ def render3D(surface, level, fov, linewidth):
         spriteHeight = int(spriteDim * (tex[0].get_height() / G_TEXDIM))
         
         #The top left corner of the sprite
-        drawStartY = int(-spriteHeight / 2 + height / 2 + spriteWidth * (level.pack.getSpriteOffset(entity[1].variation, entity[1].texture) / G_TEXDIM))
+        drawStartY = int(-spriteHeight / 2 + height / 2 + spriteWidth * (level.pack.getSpriteOffset(entity.variation, entity.texture) / G_TEXDIM))
         
         #Find the left and right of the sprite
         drawStartX = int(-spriteWidth / 2 + spriteLocation)
         drawEndX = int(spriteWidth / 2 + spriteLocation)
         
-        #Calculate a brightness for the sprite, this is based on wall distance
-        lighting = 255 * max(0.2, min(0.95, -(spriteDepth / 15) + 1))
-        
         #Skip if the sprit is off the screen
-        if drawStartX > width or drawEndX < 0 or spriteHeight > 800:
+        if drawStartX > width or drawEndX < 0 or spriteHeight > 800 or spriteDepth <= 0:
             continue
         
+        #Calculate a brightness for the sprite, this is based on wall distance
+        light = lightLevel(spriteDepth)
         
         for x in range(drawStartX, drawEndX, linewidth):
             #Only render if the stripe is on screen, and the stripe should be closer than any of the walls
             if spriteDepth > 0 and x > 0 and x < width and spriteDepth < distancebuffer[int(x / linewidth)]:
                 #Find the texture of the sprite
                 texX = int((x - drawStartX) * len(tex) / spriteWidth)
-                stripe = tex[texX]
+                stripe = level.pack.getSpriteStripe(entity.variation, entity.texture, texX, light, linewidth, spriteHeight)
                 
                 #Render the stripe onto the screen.
-                surface.blit(utility.darkenSurface(pygame.transform.scale(stripe, (linewidth, int(spriteHeight))), lighting), (x, drawStartY))
+                surface.blit(stripe, (x, drawStartY))
+
+def lightLevel(distance):
+    '''
+    Description:
+        Finds the brightness of something based on its distance from the camera
+    
+    Parameters:
+        distance: The distance from the camera
+    
+    Returns:
+        A light level between 0 and G_LIGHTLEVELS - 1, used for the shaded textures in pack
+    '''
+    
+    lighting = max(G_LIGHTMIN, min(G_LIGHTMAX, -(distance / 15) + 1))
+    return round((lighting - G_LIGHTMIN) / (G_LIGHTMAX - G_LIGHTMIN) * (G_LIGHTLEVELS - 1))
+
+def lightLevels(distances):
+    #Array version of lightLevel()
+    lighting = numpy.clip(-(distances / 15) + 1, G_LIGHTMIN, G_LIGHTMAX)
+    return numpy.rint((lighting - G_LIGHTMIN) / (G_LIGHTMAX - G_LIGHTMIN) * (G_LIGHTLEVELS - 1)).astype(int)
+
+def blitWalls(surface, level, columns, distances, walls, texXs, linewidth):
+    '''
+    Description:
+        Renders wall stripes by blitting a shaded and scaled surface for every stripe
+    
+    Parameters:
+        surface: The surface to render to
+        level: The level used for rendering
+        columns: An array of the x position of every stripe
+        distances: An array of wall distances, see castRays()
+        walls: An array of wall ids, see castRays()
+        texXs: An array of texture columns, see castRays()
+        linewidth: The width of each vertical stripe
+    
+    Notes:
+        Works with every surface format, composeWalls() should be used whenever possible
+    '''
+    
+    height = surface.get_height()
+    
+    for x, wallDistance, wall, texX in zip(columns.tolist(), distances.tolist(), walls.tolist(), texXs.tolist()):
+        #Calculates the height that the stripe should appear, pygame does not support values over 10000
+        lineHeight = abs(int(height / wallDistance))
+        if lineHeight > 10000: lineHeight = 10000
+        
+        #Find the shaded and scaled stripe, the brightness is based on wall distance
+        stripe = level.pack.getWallStripe(wall, texX, lightLevel(wallDistance), linewidth, lineHeight)
+        
+        #Render the stripe onto the screen.
+        surface.blit(stripe, (x - (linewidth / 2), -stripe.get_height() / 2 + height / 2))
+
+#Texel row index tables, keyed by (line height, viewport height, texture height)
+_rowtables = {}
+
+def rowTable(lineHeight, height, texheight):
+    '''
+    Description:
+        Finds which texture row every screen row of a stripe uses
+    
+    Parameters:
+        lineHeight: The projected height of the stripe
+        height: The height of the viewport
+        texheight: The height of the texture
+    
+    Returns:
+        An array with the texture row of every screen row, -1 for rows above and below the stripe
+    
+    Notes:
+        Tables are built once and reused, the stripe is centered on the y-axis and clipped to the viewport
+    '''
+    
+    key = (lineHeight, height, texheight)
+    table = _rowtables.get(key)
+    
+    if table is None:
+        #How far down the stripe every screen row is, the stripe is centered on the y-axis
+        offsets = numpy.arange(height) - int(-lineHeight / 2 + height / 2)
+        
+        rows = numpy.where((offsets >= 0) & (offsets < lineHeight), offsets * texheight // max(1, lineHeight), -1)
+        table = _rowtables[key] = rows.astype(numpy.int16)
+    
+    return table
+
+def composeWalls(pixels, atlas, columns, distances, walls, texXs, linewidth):
+    '''
+    Description:
+        Renders textured and shaded wall stripes directly into the pixels of a surface
+    
+    Parameters:
+        pixels: The pixels of the surface to render to, from pygame.surfarray.pixels2d()
+        atlas: The shaded walls in the surface format, from Pack.getWallAtlas()
+        columns: An array of the x position of every stripe
+        distances: An array of wall distances, see castRays()
+        walls: An array of wall ids, see castRays()
+        texXs: An array of texture columns, see castRays()
+        linewidth: The width of each vertical stripe
+    
+    Notes:
+        No surfaces are created and there is no loop over stripes, the texels of every screen column are gathered
+        at once using rowTable(), so most of the work is done by NumPy without holding the GIL
+        
+        Only writes to the columns of the stripes, so different stripes can be composed at the same time
+    '''
+    
+    width, height = pixels.shape
+    
+    #Calculates the height that the stripes should appear, same limit as blitWalls()
+    lineHeights = numpy.minimum(numpy.abs((height / distances).astype(int)), 10000)
+    
+    #Calculate a brightness for the stripes, this is based on wall distance
+    lights = lightLevels(distances)
+    
+    #Find the left and right of every stripe, clipped to the viewport
+    lefts = numpy.clip((columns - linewidth / 2).astype(int), 0, width)
+    rights = numpy.clip((columns + linewidth / 2).astype(int), 0, width)
+    
+    #Every screen column that is drawn, and the stripe that is drawn on it
+    counts = numpy.maximum(rights - lefts, 0)
+    stripes = numpy.repeat(numpy.arange(len(counts)), counts)
+    if not len(stripes):
+        return
+    xs = lefts[stripes] + numpy.arange(len(stripes)) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    
+    #Walls that are not in the pack use the unknown texture at the start of the atlas
+    walls = numpy.where((walls > 0) & (walls < len(atlas)), walls, 0)
+    used = numpy.unique(walls).tolist()
+    shaded = atlas.getWalls(used)
+    
+    #Put the textures of the walls in one array, and find where every wall starts and how big it is
+    starts = numpy.zeros(len(atlas), numpy.int32)
+    widths = numpy.ones(len(atlas), numpy.int32)
+    texheights = numpy.ones(len(atlas), numpy.int32)
+    texels = []
+    offset = 0
+    for wall in used:
+        starts[wall] = offset
+        _, widths[wall], texheights[wall] = shaded[wall].shape
+        texels.append(shaded[wall].ravel())
+        offset += shaded[wall].size
+    texels = numpy.concatenate(texels) if len(texels) > 1 else texels[0]
+    
+    #The index of the first texel of the shaded texture column of every stripe
+    bases = starts[walls] + (lights * widths[walls] + texXs) * texheights[walls]
+    
+    #Stripes with the same height and texture height share a row table
+    keys = lineHeights * 65536 + texheights[walls]
+    keys, tables = numpy.unique(keys, return_inverse=True)
+    rows = numpy.stack([rowTable(key // 65536, height, key % 65536) for key in keys.tolist()])[tables]
+    
+    #Gather the texels of every stripe, then spread the stripes over their columns
+    colors = texels.take(rows + bases[:, None], mode='clip')[stripes]
+    visible = (rows >= 0)[stripes]
+    
+    #Rows that are not part of a stripe keep their pixels
+    if xs[-1] - xs[0] == len(xs) - 1:
+        numpy.copyto(pixels[xs[0]:xs[-1] + 1], colors, casting='unsafe', where=visible)
+    else:
+        pixels[xs] = numpy.where(visible, colors, pixels[xs])
+
+def renderBand(pixels, atlas, level, posX, posY, columns, rayDirX, rayDirY, linewidth):
+    '''
+    Description:
+        Casts and composes the walls of a group of stripes
+    
+    Parameters:
+        pixels: The pixels of the surface to render to, see composeWalls()
+        atlas: The shaded walls in the surface format, see composeWalls()
+        level: The level used for rendering
+        posX: The x position of the camera
+        posY: The y position of the camera
+        columns: An array of the x position of every stripe
+        rayDirX: An array of the x components of each ray direction
+        rayDirY: An array of the y components of each ray direction
+        linewidth: The width of each vertical stripe
+    
+    Returns:
+        The wall distance of every stripe
+    '''
+    
+    distances, sides, walls, texXs = castRays(level, posX, posY, rayDirX, rayDirY)
+    composeWalls(pixels, atlas, columns, distances, walls, texXs, linewidth)
+    return distances
+
+#Thread pool used for rendering bands, created when it is first needed
+_pool = None
+_poolsize = 0
+
+def getPool(threads):
+    '''
+    Description:
+        Finds the thread pool used for rendering bands
+    
+    Parameters:
+        threads: The amount of worker threads
+    
+    Returns:
+        A concurrent.futures thread pool, replaced if the amount of threads changed
+    '''
+    
+    global _pool
+    global _poolsize
+    
+    if _pool is None or _poolsize != threads:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ThreadPoolExecutor(threads)
+        _poolsize = threads
+    
+    return _pool
+
+def castRay(level, posX, posY, rayDirX, rayDirY):
+    '''
+    Description:
+        Casts a single ray through the level map until it hits a wall
+    
+    Parameters:
+        level: The level used for casting
+        posX: The x position the ray starts at
+        posY: The y position the ray starts at
+        rayDirX: The x component of the ray direction
+        rayDirY: The y component of the ray direction
+    
+    Returns:
+        A tuple (distance, side, wall, texX), the perpendicular wall distance, the side that was hit (0 = x, 1 = y),
+        the wall id and the texture column
+    
+    Notes:
+        This is the per-column reference for castRays(), it walks the grid in pure python
+    '''
+    
+    #Find the ray tile position
+    worldX = int(posX)
+    worldY = int(posY)
+    
+    #Throws errors if ray directions are 0
+    #Finds the magnitude of 
+    if rayDirX == 0: rayDirX = 0.00001
+    deltaDistX = 1 + sqrt((rayDirY ** 2) / (rayDirX ** 2))
+    if rayDirY == 0: rayDirY = 0.00001
+    deltaDistY = 1 + sqrt((rayDirX ** 2) / (rayDirY ** 2))
+    
+    #Check if the ray is moving to the right or left, this is used so that the ray only checks on grid lines
+    if rayDirX < 0:
+        stepX = -1
+        sideDistX = (posX - worldX) * deltaDistX
+    else:
+        stepX = 1
+        sideDistX = (worldX + 1 - posX) * deltaDistX
+    
+    #Check if the ray is moving up or down, this is used so that the ray only checks on grid lines
+    if rayDirY < 0:
+        stepY = -1
+        sideDistY = (posY - worldY) * deltaDistY
+    else:
+        stepY = 1
+        sideDistY = (worldY + 1 - posY) * deltaDistY
+    
+    #Update ray until it finds a wall
+    hit = False
+    while hit == False:
+        #Update ray position, only moves on one axis every update, so that it can check on grid lines
+        if sideDistX < sideDistY:
+            sideDistX += deltaDistX
+            worldX += stepX
+            side = 0
+        else:
+            sideDistY += deltaDistY
+            worldY += stepY
+            side = 1
+        
+        if level.getElement(worldX, worldY) > 0:
+            #Exit the loop if the ray hits a wall
+            hit = True
+    
+    #Find the point on the wall where the ray hit. Equation changes if the ray hit the
+    #left or right side of the wall instead of the top or bottom side of the tile
+    if side == 1:
+        wallX = posX + ((worldY - posY + (1 - stepY) / 2) / rayDirY) * rayDirX
+    else:
+        wallX = posY + ((worldX - posX + (1 - stepX) / 2) / rayDirX) * rayDirY
+    wallX -= int(wallX)
+    
+    #Finds the distance from the player to the wall
+    if side == 0:
+        wallDistance = abs((worldX - posX + (1 - stepX) / 2) / rayDirX)
+    else:
+        wallDistance = abs((worldY - posY + (1 - stepY) / 2) / rayDirY)
+    
+    #Find the texture position from the wall position. This compensates for the constant G_TEXDIM
+    texX = int(wallX * G_TEXDIM)
+    if (side == 0 and rayDirX < 0) or (side == 1 and rayDirY > 0):
+        texX = G_TEXDIM - texX - 1
+    
+    return wallDistance, side, level.getElement(worldX, worldY), texX
+
+def castRaysReference(level, posX, posY, rayDirX, rayDirY):
+    '''
+    Description:
+        Casts every ray one at a time using castRay()
+    
+    Parameters:
+        level: The level used for casting
+        posX: The x position the rays start at
+        posY: The y position the rays start at
+        rayDirX: An array of the x components of each ray direction
+        rayDirY: An array of the y components of each ray direction
+    
+    Returns:
+        The same arrays as castRays()
+    
+    Notes:
+        Slow, only kept for checking the results of castRays()
+    '''
+    
+    results = [castRay(level, posX, posY, dirX, dirY) for dirX, dirY in zip(rayDirX.tolist(), rayDirY.tolist())]
+    distances, sides, walls, texXs = zip(*results)
+    
+    return numpy.array(distances), numpy.array(sides), numpy.array(walls), numpy.array(texXs)
+
+def castRays(level, posX, posY, rayDirX, rayDirY):
+    '''
+    Description:
+        Casts every ray together through the level map until they all hit a wall
+    
+    Parameters:
+        level: The level used for casting
+        posX: The x position the rays start at
+        posY: The y position the rays start at
+        rayDirX: An array of the x components of each ray direction
+        rayDirY: An array of the y components of each ray direction
+    
+    Returns:
+        A tuple of arrays (distances, sides, walls, texXs), see castRay()
+    
+    Notes:
+        Walks the rays over a numpy copy of the level map, only the rays that have not hit a wall yet are stepped
+        Tiles outside of the map are treated as the outer wall
+        Gives the same results as castRay() for every ray
+    '''
+    
+    grid = level.getGrid()
+    gridHeight, gridWidth = grid.shape
+    count = len(rayDirX)
+    
+    #Find the ray tile position
+    startX = int(posX)
+    startY = int(posY)
+    
+    #Throws errors if ray directions are 0, same order as castRay()
+    rayDirX = numpy.where(rayDirX == 0, 0.00001, rayDirX)
+    deltaDistX = 1 + numpy.sqrt((rayDirY ** 2) / (rayDirX ** 2))
+    rayDirY = numpy.where(rayDirY == 0, 0.00001, rayDirY)
+    deltaDistY = 1 + numpy.sqrt((rayDirX ** 2) / (rayDirY ** 2))
+    
+    #Find the step direction and the distance to the first grid line for every ray
+    stepX = numpy.where(rayDirX < 0, -1, 1)
+    sideDistX = numpy.where(rayDirX < 0, (posX - startX) * deltaDistX, (startX + 1 - posX) * deltaDistX)
+    stepY = numpy.where(rayDirY < 0, -1, 1)
+    sideDistY = numpy.where(rayDirY < 0, (posY - startY) * deltaDistY, (startY + 1 - posY) * deltaDistY)
+    
+    #Result arrays, filled in as rays hit walls
+    worldX = numpy.zeros(count, int)
+    worldY = numpy.zeros(count, int)
+    sides = numpy.zeros(count, int)
+    walls = numpy.zeros(count, int)
+    
+    #The working set only contains rays that are still travelling
+    active = numpy.arange(count)
+    activeX = numpy.full(count, startX)
+    activeY = numpy.full(count, startY)
+    activeStepX = stepX
+    activeStepY = stepY
+    activeSideX = sideDistX
+    activeSideY = sideDistY
+    activeDeltaX = deltaDistX
+    activeDeltaY = deltaDistY
+    
+    while active.size:
+        #Move every ray on one axis, so that they only check on grid lines
+        moveX = activeSideX < activeSideY
+        moveY = ~moveX
+        activeSideX = numpy.where(moveX, activeSideX + activeDeltaX, activeSideX)
+        activeSideY = numpy.where(moveY, activeSideY + activeDeltaY, activeSideY)
+        activeX = activeX + activeStepX * moveX
+        activeY = activeY + activeStepY * moveY
+        
+        #Look up the tiles, anything outside of the map is the outer wall
+        inside = (activeX >= 0) & (activeX < gridWidth) & (activeY >= 0) & (activeY < gridHeight)
+        tiles = numpy.full(active.size, level.outerwall)
+        tiles[inside] = grid[activeY[inside], activeX[inside]]
+        hit = (tiles > 0) | ~inside
+        
+        if hit.any():
+            #Store the results of the rays that hit a wall
+            done = active[hit]
+            worldX[done] = activeX[hit]
+            worldY[done] = activeY[hit]
+            sides[done] = moveY[hit]
+            walls[done] = tiles[hit]
+            
+            #Remove them from the working set
+            keep = ~hit
+            active = active[keep]
+            activeX = activeX[keep]
+            activeY = activeY[keep]
+            activeStepX = activeStepX[keep]
+            activeStepY = activeStepY[keep]
+            activeSideX = activeSideX[keep]
+            activeSideY = activeSideY[keep]
+            activeDeltaX = activeDeltaX[keep]
+            activeDeltaY = activeDeltaY[keep]
+    
+    #Find the point on the wall where the rays hit, and the distance from the player to the wall
+    sideX = sides == 0
+    distX = (worldX - posX + (1 - stepX) / 2) / rayDirX
+    distY = (worldY - posY + (1 - stepY) / 2) / rayDirY
+    wallX = numpy.where(sideX, posY + distX * rayDirY, posX + distY * rayDirX)
+    wallX -= numpy.trunc(wallX)
+    distances = numpy.abs(numpy.where(sideX, distX, distY))
+    
+    #Find the texture position from the wall position. This compensates for the constant G_TEXDIM
+    texXs = (wallX * G_TEXDIM).astype(int)
+    flip = (sideX & (rayDirX < 0)) | (~sideX & (rayDirY > 0))
+    texXs = numpy.where(flip, G_TEXDIM - texXs - 1, texXs)
+    
+    return distances, sides, walls, texXs
+
+class Panorama(object):
+    def __init__(self, level, fov, linewidth):
+        '''
+        Description:
+            A view all the way around the player that is rendered once, and scrolled to the player's direction when drawn
+        
+        Parameters:
+            level: The level used for rendering
+            fov: The field of view, see render3D()
+            linewidth: The width of each vertical stripe
+        
+        Notes:
+            Stripes are spaced evenly by angle and walls are sized by their straight line distance, so the panorama is
+            a cylinder around the player, it matches render3D() in the middle of the view
+            
+            Rendered again when the surface size, the player's position or the level changes, turning is free
+        '''
+        
+        self.level = level
+        self.fov = fov
+        self.linewidth = linewidth
+        self.image = None
+        self.key = None
+    
+    def getKey(self, surface):
+        #Everything the panorama depends on besides the player's direction
+        level = self.level
+        return (surface.get_size(), surface.get_bitsize(), self.fov, self.linewidth, level.player.x, level.player.y, level.revision,
+                tuple(level.ceilingcolor), tuple(level.floorcolor), level.pack, level.pack.revision)
+    
+    def render(self, surface):
+        #Draws the part of the panorama the player is facing, rendering it first if it is out of date
+        key = self.getKey(surface)
+        if key != self.key:
+            self.image = self.build(surface)
+            self.key = key
+        
+        width, height = surface.get_size()
+        columns = self.image.get_width()
+        
+        #Scroll the panorama so the player's direction is in the middle, wrapping around at the end
+        left = int(radians(self.level.player.direction) * columns / (2 * pi) - width / 2) % columns
+        surface.blit(self.image, (0, 0), (left, 0, width, height))
+        if left + width > columns:
+            surface.blit(self.image, (columns - left, 0), (0, 0, left + width - columns, height))
+    
+    def build(self, surface):
+        '''
+        Description:
+            Renders the panorama in the pixel format of a surface
+        
+        Parameters:
+            surface: The surface the panorama is drawn on, its height is used for the panorama
+        
+        Returns:
+            The panorama, as wide as a full turn at the scale of the middle of a render3D() view
+        '''
+        
+        level = self.level
+        width, height = surface.get_size()
+        linewidth = self.linewidth
+        
+        #Pixels per radian in the middle of the view, a fov of 90 degrees has a plane vector with a magnitude of 1
+        columns = max(1, round(2 * pi * (width / 2) / (self.fov / 90) / linewidth)) * linewidth
+        image = pygame.Surface((columns, height), 0, surface)
+        
+        posX, posY = level.player.x, level.player.y
+        
+        pygame.draw.rect(image, level.ceilingcolor, pygame.Rect(0, 0, columns, height / 2))
+        pygame.draw.rect(image, level.floorcolor, pygame.Rect(0, height / 2, columns, height / 2))
+        
+        #Every stripe covers linewidth columns and sends a ray of length 1 through its middle, so distances are straight line distances
+        stripes = numpy.arange(0, columns, linewidth) + linewidth / 2
+        angles = stripes * 2 * pi / columns
+        rayDirX = numpy.cos(angles)
+        rayDirY = numpy.sin(angles)
+        
+        if image.get_bytesize() in (2, 4):
+            atlas = level.pack.getWallAtlas(image)
+            pixels = pygame.surfarray.pixels2d(image)
+            distances = renderBand(pixels, atlas, level, posX, posY, stripes, rayDirX, rayDirY, linewidth)
+            del pixels
+        else:
+            distances, sides, walls, texXs = castRays(level, posX, posY, rayDirX, rayDirY)
+            blitWalls(image, level, stripes, distances, walls, texXs, linewidth)
+        
+        distancebuffer = distances.tolist()
+        
+        #Draw entities from farthest away to closest, like render3D()
+        entityorder = []
+        for entity in level.statics + level.items + level.enemies + level.projectiles:
+            entityorder.append((sqrt((entity.x - posX) ** 2 + (entity.y - posY) ** 2), entity))
+        entityorder.sort(key = lambda entity: entity[0], reverse = True)
+        
+        for distance, entity in entityorder:
+            if distance == 0:
+                continue
+            
+            #Find where the sprite is around the player
+            spriteLocation = (atan2(entity.y - posY, entity.x - posX) % (2 * pi)) * columns / (2 * pi)
+            
+            tex = level.pack.getSpriteSplit(entity.variation, entity.texture)
+            
+            #Find the sprite dimensions
+            spriteDim = height / distance
+            spriteWidth = int(spriteDim * (len(tex) / G_TEXDIM))
+            spriteHeight = int(spriteDim * (tex[0].get_height() / G_TEXDIM))
+            if spriteWidth == 0 or spriteHeight > 800:
+                continue
+            
+            drawStartY = int(-spriteHeight / 2 + height / 2 + spriteWidth * (level.pack.getSpriteOffset(entity.variation, entity.texture) / G_TEXDIM))
+            drawStartX = int(-spriteWidth / 2 + spriteLocation)
+            light = lightLevel(distance)
+            
+            for x in range(drawStartX, drawStartX + spriteWidth, linewidth):
+                #Stripes past either end wrap around to the other end
+                column = x % columns
+                if distance < distancebuffer[column // linewidth]:
+                    texX = int((x - drawStartX) * len(tex) / spriteWidth)
+                    image.blit(level.pack.getSpriteStripe(entity.variation, entity.texture, texX, light, linewidth, spriteHeight), (column, drawStartY))
+        
+        return image
+
+class TileLayer(object):
+    def __init__(self, level, tilesize, grid=False, transparent=False):
+        '''
+        Description:
+            A cached drawing of the walls of a level, split into square chunks that are drawn the first time they are visible
+        
+        Parameters:
+            level: The level to draw
+            tilesize: The size of a tile in pixels
+            grid: Draws black grid lines between tiles, walls are drawn inside the lines
+            transparent: The floor is left transparent instead of being drawn in the floor colour
+        
+        Notes:
+            The layer is out of date once the map, floor colour or pack changes, see isCurrent(), a single tile that
+            changed can be drawn again with drawTile()
+            
+            The chunks that were drawn the longest time ago are removed once the chunks use more than G_LAYERCACHESIZE bytes
+        '''
+        
+        self.level = level
+        self.tilesize = tilesize
+        self.grid = grid
+        self.transparent = transparent
+        self.key = self.getKey()
+        
+        #Tiles along every side of a chunk
+        self.chunktiles = max(1, G_LAYERCHUNKSIZE // tilesize)
+        self.chunks = OrderedDict()
+        self.memory = 0
+        
+        #Walls scaled to fit a tile, keyed by tile, and sprites scaled to fit half a tile, keyed by (variation, texture)
+        self.walls = {}
+        self.icons = {}
+    
+    def getKey(self):
+        #Everything the drawing depends on besides the tile size
+        return (self.level.revision, tuple(self.level.floorcolor), self.level.pack, self.level.pack.revision)
+    
+    def isCurrent(self, level, tilesize):
+        return level is self.level and tilesize == self.tilesize and self.getKey() == self.key
+    
+    def getWall(self, tile):
+        wall = self.walls.get(tile)
+        if wall is None:
+            size = self.tilesize - 1 if self.grid else self.tilesize
+            wall = self.walls[tile] = pygame.transform.scale(self.level.pack.getWall(tile), (size, size))
+        return wall
+    
+    def getIcon(self, variation, texture):
+        icon = self.icons.get((variation, texture))
+        if icon is None:
+            icon = self.icons[(variation, texture)] = utility.aspect(self.level.pack.getSprite(variation, texture), (int(self.tilesize / 2), int(self.tilesize / 2)))
+        return icon
+    
+    def getChunk(self, chunkx, chunky):
+        chunk = self.chunks.get((chunkx, chunky))
+        if chunk is not None:
+            self.chunks.move_to_end((chunkx, chunky))
+            return chunk
+        
+        left, top = chunkx * self.chunktiles, chunky * self.chunktiles
+        width = min(self.chunktiles, self.level.getWidth() - left)
+        height = min(self.chunktiles, self.level.getHeight() - top)
+        
+        chunk = pygame.Surface((width * self.tilesize, height * self.tilesize))
+        chunk.fill(self.level.floorcolor)
+        if self.transparent:
+            chunk.set_colorkey(self.level.floorcolor)
+        
+        if self.grid:
+            #Lines along the top and left of every tile, the lines along the bottom and right of the map are not included
+            for row in range(height):
+                pygame.draw.line(chunk, (0, 0, 0), (0, row * self.tilesize), (chunk.get_width(), row * self.tilesize), 1)
+            for col in range(width):
+                pygame.draw.line(chunk, (0, 0, 0), (col * self.tilesize, 0), (col * self.tilesize, chunk.get_height()), 1)
+        
+        inset = 1 if self.grid else 0
+        tiles = self.level.getGrid()[top:top + height, left:left + width]
+        for row, col in zip(*numpy.nonzero(tiles)):
+            chunk.blit(self.getWall(int(tiles[row, col])), (col * self.tilesize + inset, row * self.tilesize + inset))
+        
+        self.chunks[(chunkx, chunky)] = chunk
+        self.memory += chunk.get_width() * chunk.get_height() * chunk.get_bytesize()
+        
+        #Remove the least recently drawn chunks, but never the new one
+        while self.memory > G_LAYERCACHESIZE and len(self.chunks) > 1:
+            _, old = self.chunks.popitem(False)
+            self.memory -= old.get_width() * old.get_height() * old.get_bytesize()
+        
+        return chunk
+    
+    def drawTile(self, x, y):
+        #Draws a tile again after it was changed with Level.setElement(), the layer only stays current if nothing else changed
+        key = self.getKey()
+        if key[1:] != self.key[1:] or key[0] != self.key[0] + 1:
+            return
+        self.key = key
+        
+        chunk = self.chunks.get((x // self.chunktiles, y // self.chunktiles))
+        if chunk is not None:
+            inset = 1 if self.grid else 0
+            position = ((x % self.chunktiles) * self.tilesize + inset, (y % self.chunktiles) * self.tilesize + inset)
+            size = self.tilesize - inset
+            
+            chunk.fill(self.level.floorcolor, position + (size, size))
+            tile = self.level.getElement(x, y)
+            if tile != 0:
+                chunk.blit(self.getWall(tile), position)
+    
+    def draw(self, surface, x, y):
+        '''
+        Description:
+            Draws the chunks of the layer that are visible on a surface
+        
+        Parameters:
+            surface: The surface to draw on
+            x: The x position of the top left corner of the map on the surface
+            y: The y position of the top left corner of the map on the surface
+        '''
+        
+        x, y = floor(x), floor(y)
+        size = self.chunktiles * self.tilesize
+        clip = surface.get_clip()
+        
+        left = max(0, floor((clip.left - x) / size))
+        top = max(0, floor((clip.top - y) / size))
+        right = min(ceil(self.level.getWidth() / self.chunktiles), ceil((clip.right - x) / size))
+        bottom = min(ceil(self.level.getHeight() / self.chunktiles), ceil((clip.bottom - y) / size))
+        
+        for chunky in range(top, bottom):
+            for chunkx in range(left, right):
+                surface.blit(self.getChunk(chunkx, chunky), (x + chunkx * size, y + chunky * size))
 
 def render2D(surface, rect, level, zoom, playerimage):
     '''
@@ -216,12 +854,18 @@ def render2D(surface, rect, level, zoom, playerimage):
         Order of rendering:
             - Walls
             - Sprites
+        
+        Walls are drawn from a TileLayer that the level keeps, it is only drawn again when the zoom or the level changes
     '''
     
     #Find the middle of the screen
     middlex = rect[2] / 2
     middley = rect[3] / 2
-    tilesize = G_TEXDIM * zoom
+    tilesize = round(G_TEXDIM * zoom)
+    
+    if level.minimap is None or not level.minimap.isCurrent(level, tilesize):
+        level.minimap = TileLayer(level, tilesize, transparent=True)
+    layer = level.minimap
     
     #Create image
     image = pygame.Surface(rect[2:])
@@ -229,14 +873,11 @@ def render2D(surface, rect, level, zoom, playerimage):
     pygame.draw.rect(image, (0, 0, 0), pygame.Rect(-level.player.x * tilesize + middlex, -level.player.y * tilesize + middley, level.getWidth() * tilesize, level.getHeight() * tilesize), 2)
     
     #Render walls
-    for rowposition, row in enumerate(level.map):
-        for colposition, tile in enumerate(row):
-            if tile != 0:
-                image.blit(pygame.transform.scale(level.pack.getWall(tile), (round(tilesize), round(tilesize))), ((colposition - level.player.x) * tilesize + middlex, (rowposition - level.player.y) * tilesize + middley))
+    layer.draw(image, -level.player.x * tilesize + middlex, -level.player.y * tilesize + middley)
     
-    #Render entities
-    for entity in level.statics + level.items + level.enemies + level.projectiles:
-        texture = utility.aspect(level.pack.getSprite(entity.variation, entity.texture), (int(tilesize / 2), int(tilesize / 2)))
+    #Render entities that are inside the view
+    for entity in level.queryAABB(level.player.x, level.player.y, max(middlex, middley) / tilesize + 1):
+        texture = layer.getIcon(entity.variation, entity.texture)
         x = int((entity.x - level.player.x) * tilesize + middlex - int(texture.get_width() / 2))
         y = int((entity.y - level.player.y) * tilesize + middley - int(texture.get_height() / 2))
         image.blit(texture, (x, y))
@@ -266,6 +266,8 @@ class TextMenu(object):
         Notes:
             The 3 element button tuples are:
                 (Text, Color, HighlightColor)
+            
+            Remembers which buttons were highlighted when they were last rendered, see renderChanged()
         '''
         
         self.buttons = []
@@ -275,6 +277,8 @@ class TextMenu(object):
                                        ((parentdim[0] / 2) - (buttondim[0] / 2),
                                        (parentdim[1] / 2) + ((buttondim[1] + spacing) * position) + offset,
                                        buttondim[0], buttondim[1])))
+        
+        self.rendered = [False] * len(self.buttons)
     
     def setDimensions(self, buttondim, parentdim, spacing, offset):
         for position in range(len(self.buttons)):
@@ -304,6 +308,17 @@ class TextMenu(object):
     def render(self, surface):
         for button in self.buttons:
             button.render(surface)
+        self.rendered = [button.selected for button in self.buttons]
+    
+    def renderChanged(self, surface):
+        #Renders only the buttons that were highlighted or unhighlighted since they were last rendered, returns their rectangles
+        rects = []
+        for position, button in enumerate(self.buttons):
+            if button.selected != self.rendered[position]:
+                button.render(surface)
+                self.rendered[position] = button.selected
+                rects.append(button.rect)
+        return rects
 
 class ImageMenu(object):
     def __init__(self, parentrect, buttondim, columns, images):
@@ -0,0 +1,140 @@
+'''
+Author: Kyle Charters
+
+Description:
+    The headless module runs levels without a window or any menus, for soak tests and throughput tests
+
+Contents:
+    - initialize()
+    - idle()
+    - wander()
+    - run()
+    - start()
+
+Notes:
+    initialize() must be called before world, pack or constants are imported, it sets up pygame with SDL's dummy
+    video driver, which is enough for fonts and textures to load
+    
+    States from the state module are never created, levels are stepped directly with world.Level.update
+    
+    A script decides the player input for every tick, it is called as script(tick, level) and returns a tuple
+    (forward, strafe, turn, sprint, shooting), see world.Player.control
+    
+    Usage:
+        python3 headless.py levels/Maze.level --ticks 100000 --script wander --seed 4
+'''
+
+import os
+import random
+import time
+
+def initialize():
+    '''
+    Description:
+        Sets up pygame without a display
+    
+    Notes:
+        Textures are converted to the display format, so a 1x1 display surface is created on the dummy driver
+    '''
+    
+    #Use SDL's dummy video driver so no window is opened
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    
+    #Initialize pygame before everything else because of dependencies
+    import pygame
+    pygame.display.init()
+    pygame.font.init()
+    pygame.display.set_mode((1, 1))
+
+def idle(tick, level):
+    #Script that never gives any input
+    return (0, 0, 0, False, False)
+
+def wander(seed=0, hold=60):
+    '''
+    Description:
+        Creates a script that presses random keys
+    
+    Parameters:
+        seed: The random seed, the same seed always gives the same input
+        hold: The amount of ticks every random input is held for
+    
+    Returns:
+        A script function
+    '''
+    
+    generator = random.Random(seed)
+    current = [None]
+    
+    def script(tick, level):
+        if tick % hold == 0 or current[0] is None:
+            current[0] = (generator.choice((-1, 0, 1, 1)), generator.choice((-1, 0, 1)), generator.choice((-1, 0, 1)), generator.random() < 0.3, generator.random() < 0.5)
+        return current[0]
+    
+    return script
+
+def run(level, ticks, script=idle, delta=None):
+    '''
+    Description:
+        Steps a level a number of times with scripted input
+    
+    Parameters:
+        level: The level to step
+        ticks: The amount of times to update the level
+        script: The script that decides the player input every tick
+        delta: The time of every tick in seconds, defaults to S_TIMESTEP
+    
+    Returns:
+        A dictionary of results, including the amount of ticks run every second
+    
+    Notes:
+        Keeps running after the level is finished or the player dies, so soak tests always run the same amount of ticks
+    '''
+    
+    from constants import S_TIMESTEP
+    
+    if delta is None:
+        delta = S_TIMESTEP
+    
+    start = time.perf_counter()
+    
+    for tick in range(ticks):
+        forward, strafe, turn, sprint, shooting = script(tick, level)
+        level.player.control(forward, strafe, turn, sprint, shooting, delta)
+        level.update(delta)
+    
+    seconds = time.perf_counter() - start
+    
+    return {"ticks": ticks,
+            "seconds": seconds,
+            "ticks per second": ticks / seconds if seconds > 0 else float("inf"),
+            "finished": level.finished,
+            "dead": level.player.dead,
+            "player": (level.player.x, level.player.y, level.player.direction, level.player.health),
+            "enemies": len(level.enemies),
+            "projectiles": len(level.projectiles)}
+
+def start(arguments=None):
+    import argparse
+    import json
+    
+    parser = argparse.ArgumentParser(description="Step a level without a window")
+    parser.add_argument("level", help="the level file to run")
+    parser.add_argument("--ticks", type=int, default=10000, help="the amount of level updates")
+    parser.add_argument("--script", choices=("idle", "wander"), default="wander", help="the player input")
+    parser.add_argument("--seed", type=int, default=0, help="the random seed used by the wander script")
+    parser.add_argument("--columns", action="store_true", help="update enemies and projectiles as numpy arrays from the start")
+    arguments = parser.parse_args(arguments)
+    
+    initialize()
+    import world
+    
+    level = world.Level(arguments.level)
+    if arguments.columns:
+        level.useColumns()
+    script = idle if arguments.script == "idle" else wander(arguments.seed)
+    
+    print(json.dumps(run(level, arguments.ticks, script)))
+
+if __name__ == "__main__":
+    start()
@@ -28,6 +28,7 @@ def start():
     import state
     import file
     import utility
+    from constants import S_TIMESTEP, S_MAXSTEPS
     
     #Loads settings into memory
     setting.loadSettings()
@@ -52,6 +53,9 @@ def start():
     #Create the debugger class
     debugger = utility.Debugger()
     
+    #Simulation time that has not been stepped yet
+    accumulator = 0
+    
     running = True
     while running:
         #Find current update data
@@ -59,17 +63,42 @@ def start():
         keys = pygame.key.get_pressed()
         delta = min(fpsclock.get_time() / 1000, 0.5)
         
-        #Update the current state as well as the debugger
-        statemanager.update(window, delta, events, keys)
-        debugger.update(window, delta, events, keys, fpsclock)
+        #Step the simulation at a fixed rate no matter how long rendering takes
+        accumulator += delta
+        steps = 0
+        while accumulator >= S_TIMESTEP and steps < S_MAXSTEPS:
+            statemanager.simulate(S_TIMESTEP, keys)
+            accumulator -= S_TIMESTEP
+            steps += 1
+        
+        #If the simulation could not catch up, drop the time that is left so it does not keep falling behind
+        if accumulator >= S_TIMESTEP:
+            accumulator %= S_TIMESTEP
+        
+        #Tell the current state how far it is between the last two simulation steps
+        statemanager.interpolate(accumulator / S_TIMESTEP)
         
-        #Quit game if pygame called a quit event
+        #The fps overlay is drawn over the frame, so the whole frame is drawn while it is shown
+        fullframe = debugger.showfps
+        if fullframe:
+            statemanager.redraw()
+        
+        #Quit game if pygame called a quit event, draw everything again if the window was uncovered
         for event in events:
             if event.type == pygame.QUIT:
                 running = False
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                statemanager.redraw()
+        
+        #Update the current state as well as the debugger
+        rects = statemanager.update(window, delta, events, keys)
+        debugger.update(window, delta, events, keys, fpsclock)
         
-        #Swaps the screen buffer (Same as .update() except it updates entire surface) 
-        pygame.display.flip()
+        #Swaps the screen buffer (Same as .update() except it updates entire surface), or only updates the rectangles the state changed
+        if rects is None or fullframe:
+            pygame.display.flip()
+        elif rects:
+            pygame.display.update(rects)
         fpsclock.tick(60)
     
     #Saves the settings to settings.json
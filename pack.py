@@ -6,15 +6,57 @@ Description:
 
 Contents:
     - Pack
+    - StripeCache
+    - WallAtlas
+    - acquire()
+    - release()
+    - evict()
+    - reload()
+    - quantizeHeight()
+    - lightValue()
+    - lightValues()
+    - shadeSplit()
+    - getWarmupPool()
+    - splitImage()
+    - getPackKey()
+    - loadPackPixels()
+    - compilePack()
     - listPacks()
 
 Notes:
-    None
+    Decoded textures are kept in a cache file inside every pack folder, see PACKCACHE, it is compiled again when
+    pack.def or any of its textures is changed
+    
+    Surfaces and columns of a texture are only built when it is first used, so textures a level never draws do not
+    take up memory as surfaces or in the wall atlas, see WallAtlas
+    
+    Pack.warm() shades walls into the wall atlas and copies the pixels of sprites ahead of time on a thread pool,
+    surfaces are only ever built on the thread that asks for them
 '''
 
+from constants import G_LIGHTLEVELS, G_LIGHTMIN, G_LIGHTMAX, G_STRIPECACHESIZE, G_WARMUPTHREADS
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+import os
+import tempfile
+import threading
+import json
+import pygame
+import pygame.surfarray
+import numpy
 import file
 import utility
 
+#Pack cache file name and format version, caches of other versions are compiled again
+PACKCACHE = "pack.cache"
+PACKCACHEVERSION = 1
+
+#Thread pool that builds textures ahead of time, see getWarmupPool()
+_warmuppool = None
+
+#Packs shared by every level, keyed by name, see acquire()
+_registry = {}
+
 class Pack(object):
     def __init__(self, name):
         '''
@@ -25,62 +67,536 @@ class Pack(object):
             name: The name of the pack
         
         Notes:
-            Loads packs from folders inside the "pack" folder
+            Loads packs from folders inside the "pack" folder, textures are read from the pack cache, see loadPackPixels()
+            
+            Surfaces and columns are built the first time a texture is asked for, until then the texture lists hold None
+            
+            Shaded copies of textures are built the first time they are asked for, at one of G_LIGHTLEVELS
+            brightness levels between G_LIGHTMIN and G_LIGHTMAX
+            
+            Levels share packs through acquire() and release() instead of creating their own
         '''
         
         self.name = name
         
+        #Amount of acquire() calls that were not released yet
+        self.references = 0
+        
+        #Textures that are being read on the warm up thread pool
+        self.warming = []
+        
+        #Guards building textures, the warm up threads and the thread that draws can ask for the same texture
+        self.lock = threading.RLock()
+        
+        #Incremented every time the pack is loaded, used to keep drawings of textures up to date
+        self.revision = 0
+        
+        self.load()
+    
+    def load(self):
+        #Loads the pack from its folder, anything that was built before is thrown away
+        self.collectWarming(True)
+        self.revision += 1
+        
         #Create empty arrays
         self.wall = []
         self.wallsplit = []
+        self.wallpixels = []
         self.sprite = [[], [], [], []]
         self.spritesplit = [[], [], [], []]
+        self.spritepixels = [[], [], [], []]
         self.spriteoffset = [[], [], [], []]
         
-        directory = "packs/" + name + "/"
+        #Sprite pixels copied by the warm up threads, keyed by (variation, index)
+        self.decoded = {}
+        
+        #Shaded texture caches, keyed by (texture, light level)
+        self.shadedwallsplit = {}
+        self.shadedspritesplit = {}
+        
+        #Shaded walls mapped to surface pixel formats, keyed by format, see getWallAtlas()
+        self.wallatlas = {}
+        
+        #Average colour of every wall, see getWallColors()
+        self.wallcolors = None
+        
+        #Scaled stripes that are ready to be drawn
+        self.stripecache = StripeCache(G_STRIPECACHESIZE)
+        
+        directory = "packs/" + self.name + "/"
         if file.exists(directory):
             data = file.loadJson(directory + "pack.def")
+            walls, sprites = loadPackPixels(directory, data)
             
-            for texture in data['wall']:
-                image = file.loadImage(directory + texture)
-                
-                self.wall.append(image)
-                self.wallsplit.append(utility.splitSurface(image))
+            for pixels in walls:
+                self.wall.append(None)
+                self.wallsplit.append(None)
+                #Indexed [x, y, channel] like pygame.surfarray
+                self.wallpixels.append(pixels.transpose(1, 0, 2))
             
-            for texture in data['sprite']:
-                image = file.loadImage(directory + texture[1], (0, 0, 0))
-                
-                self.sprite[texture[0]].append(image)
-                self.spritesplit[texture[0]].append(utility.splitSurface(image, (0, 0, 0), True))
+            for texture, pixels in zip(data['sprite'], sprites):
+                self.sprite[texture[0]].append(None)
+                self.spritesplit[texture[0]].append(None)
+                self.spritepixels[texture[0]].append(pixels)
                 self.spriteoffset[texture[0]].append(texture[2])
             
             self.unknown = file.loadImage("core/tex/unknown.png")
             self.unknownsplit = utility.splitSurface(self.unknown)
+            self.unknownpixels = pygame.surfarray.array3d(self.unknown)
+    
+    def decodeSprite(self, variation, index):
+        #Pixels of a sprite ready for pygame.image.frombytes(), indexed [y, x, channel], can be called from any thread
+        with self.lock:
+            pixels = self.decoded.pop((variation, index), None)
+        if pixels is None:
+            pixels = numpy.array(self.spritepixels[variation][index - 1])
+        return pixels
+    
+    def buildWall(self, index):
+        #Builds the surface and columns of a wall from its pixels, the wall is assigned last as it marks the build as done
+        with self.lock:
+            if self.wall[index - 1] is None:
+                pixels = self.wallpixels[index - 1]
+                image = pygame.image.frombytes(pixels.transpose(1, 0, 2).tobytes(), pixels.shape[:2], "RGB").convert()
+                
+                self.wallsplit[index - 1] = splitImage(image)
+                self.wall[index - 1] = image
+    
+    def buildSprite(self, variation, index):
+        #Builds the surface and columns of a sprite from its pixels, the sprite is assigned last as it marks the build as done
+        with self.lock:
+            if self.sprite[variation][index - 1] is None:
+                pixels = self.decodeSprite(variation, index)
+                image = pygame.image.frombytes(pixels.tobytes(), pixels.shape[1::-1], "RGBA")
+                image.set_colorkey((0, 0, 0))
+                
+                #Columns are drawn onto black, transparent pixels become the color key
+                flat = pygame.Surface(image.get_size()).convert()
+                flat.blit(image, (0, 0))
+                flat.set_colorkey((0, 0, 0))
+                
+                self.spritesplit[variation][index - 1] = splitImage(flat)
+                self.sprite[variation][index - 1] = image
+    
+    def warmSprite(self, variation, index):
+        #Copies the pixels of a sprite out of the pack cache on a warm up thread, so building its surface does not wait for the disk
+        pixels = self.decodeSprite(variation, index)
+        
+        with self.lock:
+            if self.sprite[variation][index - 1] is None:
+                self.decoded[(variation, index)] = pixels
+    
+    def warm(self, walls=(), sprites=()):
+        '''
+        Description:
+            Prepares textures on the warm up thread pool, so they are ready before they are first drawn
+        
+        Parameters:
+            walls: Indices of walls
+            sprites: (variation, index) tuples of sprites
+        
+        Returns:
+            A list of futures, one for every texture that was not prepared yet
+        
+        Notes:
+            Indices that are not in the pack are skipped
+            
+            Walls are shaded into the wall atlas of the display's pixel format, that is what render3D() draws them
+            from, see WallAtlas
+            
+            Only the pixels of sprites are copied on the pool, surfaces are built by the thread that first asks for
+            the texture
+        '''
+        
+        self.collectWarming()
+        
+        pool = getWarmupPool()
+        futures = []
+        
+        #Surfaces made before the display use the default pixel format
+        surface = pygame.display.get_surface()
+        if surface is None:
+            surface = pygame.Surface((1, 1))
+        
+        if surface.get_bytesize() in (2, 4):
+            atlas = self.getWallAtlas(surface)
+            for index in walls:
+                if 0 < index <= len(self.wall) and atlas.walls[index] is None:
+                    futures.append(pool.submit(atlas.getWalls, [index]))
+        
+        with self.lock:
+            for variation, index in sprites:
+                if 0 < index <= len(self.sprite[variation]) and self.sprite[variation][index - 1] is None and (variation, index) not in self.decoded:
+                    futures.append(pool.submit(self.warmSprite, variation, index))
+        
+        self.warming += futures
+        return futures
+    
+    def collectWarming(self, block=False):
+        #Forgets warm ups that are done, waits for all of them when block is True, errors from the pool are raised here
+        if block:
+            wait(self.warming)
+        
+        for future in self.warming:
+            if future.done():
+                future.result()
+        
+        self.warming = [future for future in self.warming if not future.done()]
     
     def getWall(self, index):
         if 0 < index <= len(self.wall):
+            if self.wall[index - 1] is None:
+                self.buildWall(index)
             return self.wall[index - 1]
         return self.unknown
     
+    def getWalls(self):
+        #Every wall in the order of pack.def
+        return [self.getWall(index) for index in range(1, len(self.wall) + 1)]
+    
     def getWallSplit(self, index):
         if 0 < index <= len(self.wallsplit):
+            if self.wallsplit[index - 1] is None:
+                self.buildWall(index)
             return self.wallsplit[index - 1]
         return self.unknownsplit
     
+    def getWallPixels(self, index):
+        #Pixel array of a wall, indexed [x, y, channel]
+        if 0 < index <= len(self.wallpixels):
+            return self.wallpixels[index - 1]
+        return self.unknownpixels
+    
+    def getShadedWallSplit(self, index, light):
+        key = (index, light)
+        if key not in self.shadedwallsplit:
+            self.shadedwallsplit[key] = shadeSplit(self.getWallSplit(index), light)
+        return self.shadedwallsplit[key]
+    
+    def getWallStripe(self, index, texX, light, width, height):
+        #Shaded wall column scaled to (width, height), the height is quantized with quantizeHeight()
+        height = quantizeHeight(height)
+        key = (-1, index, texX, light, width, height)
+        
+        stripe = self.stripecache.get(key)
+        if stripe is None:
+            stripe = pygame.transform.scale(self.getShadedWallSplit(index, light)[texX], (width, height))
+            self.stripecache.put(key, stripe)
+        return stripe
+    
+    def getWallAtlas(self, surface):
+        #Shaded walls mapped to the pixel format of the surface, see WallAtlas
+        key = (surface.get_bitsize(), surface.get_masks())
+        if key not in self.wallatlas:
+            self.wallatlas[key] = WallAtlas(self, surface)
+        return self.wallatlas[key]
+    
+    def getWallColors(self):
+        #Average colour of every wall, indexed [wall, channel], wall 0 is the unknown texture
+        if self.wallcolors is None:
+            self.wallcolors = numpy.array([self.getWallPixels(index).mean((0, 1)) for index in range(len(self.wallpixels) + 1)]).round().astype(numpy.uint8)
+        return self.wallcolors
+    
     def getSprite(self, variation, index):
         if 0 < index <= len(self.sprite[variation]):
+            if self.sprite[variation][index - 1] is None:
+                self.buildSprite(variation, index)
             return self.sprite[variation][index - 1]
         return self.unknown
     
+    def getSprites(self, variation):
+        #Every sprite of a variation in the order of pack.def
+        return [self.getSprite(variation, index) for index in range(1, len(self.sprite[variation]) + 1)]
+    
     def getSpriteSplit(self, variation, index):
         if 0 < index <= len(self.spritesplit[variation]):
+            if self.spritesplit[variation][index - 1] is None:
+                self.buildSprite(variation, index)
             return self.spritesplit[variation][index - 1]
         return self.unknownsplit
     
+    def getShadedSpriteSplit(self, variation, index, light):
+        key = (variation, index, light)
+        if key not in self.shadedspritesplit:
+            self.shadedspritesplit[key] = shadeSplit(self.getSpriteSplit(variation, index), light)
+        return self.shadedspritesplit[key]
+    
+    def getSpriteStripe(self, variation, index, texX, light, width, height):
+        #Shaded sprite column scaled to (width, height), the height is quantized with quantizeHeight()
+        height = quantizeHeight(height)
+        key = (variation, index, texX, light, width, height)
+        
+        stripe = self.stripecache.get(key)
+        if stripe is None:
+            stripe = pygame.transform.scale(self.getShadedSpriteSplit(variation, index, light)[texX], (width, height))
+            self.stripecache.put(key, stripe)
+        return stripe
+    
     def getSpriteOffset(self, variation, index):
         if 0 < index <= len(self.spriteoffset[variation]):
             return self.spriteoffset[variation][index - 1]
         return 0
 
+def acquire(name):
+    '''
+    Description:
+        Gets the shared pack with a name, it is only loaded if nothing is using it yet
+    
+    Parameters:
+        name: The name of the pack
+    
+    Returns:
+        The shared pack, give it back with release() once it is not used anymore
+    '''
+    
+    shared = _registry.get(name)
+    if shared is None:
+        shared = _registry[name] = Pack(name)
+    
+    shared.references += 1
+    return shared
+
+def release(shared):
+    #Gives back a pack from acquire(), it is forgotten once nothing is using it
+    shared.references -= 1
+    if shared.references <= 0 and _registry.get(shared.name) is shared:
+        del _registry[shared.name]
+
+def evict(name):
+    #Forgets a shared pack, anything using it keeps it but the next acquire() loads the pack again
+    _registry.pop(name, None)
+
+def reload(name):
+    #Loads a shared pack again in place, so everything using it gets the new textures, returns None if it is not shared
+    shared = _registry.get(name)
+    if shared is not None:
+        shared.load()
+    return shared
+
+class StripeCache(object):
+    def __init__(self, limit):
+        '''
+        Description
+            A least recently used cache of scaled texture stripes
+        
+        Parameters:
+            limit: The most memory the stored stripes can use, in bytes
+        
+        Notes:
+            When the limit is reached the stripes that were used the longest time ago are removed
+            
+            Counts hits, misses and evictions for sizing the cache
+        '''
+        
+        self.limit = limit
+        self.memory = 0
+        self.stripes = OrderedDict()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key):
+        stripe = self.stripes.get(key)
+        
+        if stripe is None:
+            self.misses += 1
+        else:
+            #Mark the stripe as the most recently used
+            self.stripes.move_to_end(key)
+            self.hits += 1
+        
+        return stripe
+    
+    def put(self, key, stripe):
+        size = stripe.get_width() * stripe.get_height() * stripe.get_bytesize()
+        
+        #Stripes bigger than the whole cache are never stored
+        if size > self.limit:
+            return
+        
+        if key in self.stripes:
+            old = self.stripes.pop(key)
+            self.memory -= old.get_width() * old.get_height() * old.get_bytesize()
+        
+        self.stripes[key] = stripe
+        self.memory += size
+        
+        #Remove the least recently used stripes until the cache fits in the limit
+        while self.memory > self.limit:
+            _, old = self.stripes.popitem(False)
+            self.memory -= old.get_width() * old.get_height() * old.get_bytesize()
+            self.evictions += 1
+    
+    def clear(self):
+        self.stripes.clear()
+        self.memory = 0
+    
+    def getStats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "stripes": len(self.stripes), "memory": self.memory, "limit": self.limit}
+
+class WallAtlas(object):
+    def __init__(self, pack, surface):
+        '''
+        Description
+            Every shaded copy of the walls of a pack, mapped to the pixel format of a surface
+        
+        Parameters:
+            pack: The pack the walls are from
+            surface: A surface with the pixel format to map to
+        
+        Notes:
+            A wall is only mapped the first time it is asked for, each wall is indexed [light, x, y] so walls of
+            different sizes can be in the same atlas
+            
+            Wall 0 is the unknown texture, walls can be asked for from any thread
+        '''
+        
+        self.pack = pack
+        
+        #Only the pixel format of the surface is needed
+        self.format = pygame.Surface((1, 1), 0, surface)
+        
+        self.walls = [None] * (len(pack.wallpixels) + 1)
+        self.lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self.walls)
+    
+    def getWalls(self, indices):
+        #Maps the walls that were not mapped yet, returns the list of every wall in the atlas
+        with self.lock:
+            for index in indices:
+                if self.walls[index] is None:
+                    pixels = self.pack.getWallPixels(index)
+                    shaded = (pixels * lightValues()[:, None, None, None]).astype(numpy.uint8)
+                    self.walls[index] = pygame.surfarray.map_array(self.format, shaded.reshape((-1,) + pixels.shape[1:])).reshape(shaded.shape[:3])
+        return self.walls
+
+def quantizeHeight(height):
+    #Round a stripe height so that stripes with nearly the same height share a cache entry, the error is at most 1/64 of the height
+    step = max(1, height >> 6)
+    return max(1, round(height / step) * step)
+
+def lightValue(light):
+    #Find the brightness of a light level, between G_LIGHTMIN and G_LIGHTMAX
+    return G_LIGHTMIN + (G_LIGHTMAX - G_LIGHTMIN) * light / (G_LIGHTLEVELS - 1)
+
+def lightValues():
+    #Find the brightness of every light level, indexed by light level
+    return G_LIGHTMIN + (G_LIGHTMAX - G_LIGHTMIN) * numpy.arange(G_LIGHTLEVELS) / (G_LIGHTLEVELS - 1)
+
+def shadeSplit(split, light):
+    #Create darkened copies of split texture columns, the copies keep their color key
+    return [utility.darkenSurface(stripe.copy(), 255 * lightValue(light)) for stripe in split]
+
+def getWarmupPool():
+    #Thread pool shared by every pack, created when it is first needed
+    global _warmuppool
+    if _warmuppool is None:
+        _warmuppool = ThreadPoolExecutor(G_WARMUPTHREADS, "pack")
+    return _warmuppool
+
+def splitImage(image):
+    #Split an image into columns 1 pixel wide, the columns share the image's pixels and color key
+    return [image.subsurface((x, 0, 1, image.get_height())) for x in range(image.get_width())]
+
+def getPackKey(directory, data):
+    #Key of a pack's sources, changes when pack.def or any texture is modified
+    sources = ["pack.def"] + data['wall'] + [texture[1] for texture in data['sprite']]
+    return json.dumps([PACKCACHEVERSION] + [[source, os.stat(directory + source).st_mtime_ns] for source in sources])
+
+def loadPackPixels(directory, data):
+    '''
+    Description:
+        Loads the decoded textures of a pack from its cache, the cache is compiled first if it is missing or out of date
+    
+    Parameters:
+        directory: The folder of the pack, must end with a slash
+        data: The pack.def dictionary
+    
+    Returns:
+        A tuple (walls, sprites) of read only pixel arrays indexed [y, x, channel] in the order of pack.def, walls
+        are RGB and sprites are RGBA
+    '''
+    
+    key = getPackKey(directory, data)
+    
+    try:
+        with open(directory + PACKCACHE, 'rb') as cache:
+            header = cache.readline()
+        offset = len(header)
+        header = json.loads(header.decode("utf-8"))
+        
+        if header['key'] == key:
+            #Memory mapped, so only the pixels of textures that are used are read
+            pixels = numpy.memmap(directory + PACKCACHE, numpy.uint8, 'r', offset)
+            textures = []
+            offset = 0
+            for shape in header['shapes']:
+                size = shape[0] * shape[1] * shape[2]
+                textures.append(pixels[offset:offset + size].reshape(shape))
+                offset += size
+            return textures[:len(data['wall'])], textures[len(data['wall']):]
+    except (OSError, ValueError, KeyError, TypeError):
+        #A missing or broken cache is compiled again
+        pass
+    
+    return compilePack(directory, data, key)
+
+def compilePack(directory, data, key=None):
+    '''
+    Description:
+        Decodes every texture of a pack and saves the pixels in the pack's cache file
+    
+    Parameters:
+        directory: The folder of the pack, must end with a slash
+        data: The pack.def dictionary
+        key: The key of the pack's sources, see getPackKey()
+    
+    Returns:
+        A tuple (walls, sprites), see loadPackPixels()
+    
+    Notes:
+        The cache is a line of json with the key and the shape of every texture, followed by the pixels of every
+        texture in the order of pack.def
+        
+        Walls are drawn onto black first, like they are drawn onto the columns they are split into
+    '''
+    
+    if key is None:
+        key = getPackKey(directory, data)
+    
+    walls = []
+    for texture in data['wall']:
+        image = file.loadImage(directory + texture)
+        flat = pygame.Surface(image.get_size())
+        flat.blit(image, (0, 0))
+        walls.append(numpy.frombuffer(pygame.image.tobytes(flat, "RGB"), numpy.uint8).reshape((flat.get_height(), flat.get_width(), 3)))
+    
+    sprites = []
+    for texture in data['sprite']:
+        image = file.loadImage(directory + texture[1])
+        sprites.append(numpy.frombuffer(pygame.image.tobytes(image, "RGBA"), numpy.uint8).reshape((image.get_height(), image.get_width(), 4)))
+    
+    header = json.dumps({"key": key, "shapes": [pixels.shape for pixels in walls + sprites]}).encode("utf-8")
+    
+    #Write to a new file and then replace the old one, so a cache is never left half written
+    #Every call gets its own file, processes that compile the same pack at once do not write over each other
+    temporary = None
+    try:
+        handle, temporary = tempfile.mkstemp(".tmp", PACKCACHE + ".", directory)
+        with os.fdopen(handle, 'wb') as cache:
+            cache.write(header + b"\n")
+            for pixels in walls + sprites:
+                cache.write(pixels.tobytes())
+        os.replace(temporary, directory + PACKCACHE)
+    except OSError:
+        #The cache is only for faster loading, the pack still works without it
+        if temporary is not None and os.path.exists(temporary):
+            os.remove(temporary)
+    
+    return walls, sprites
+
 def listPacks():
     return list(map(lambda name: name.capitalize(), file.listFolders("packs/")))
\ No newline at end of file
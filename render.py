@@ -0,0 +1,143 @@
+'''
+Author: Kyle Charters
+
+Description:
+    The render module renders still frames of a level without opening a window
+
+Contents:
+    - initialize()
+    - renderFrame()
+    - renderLevel()
+    - start()
+
+Notes:
+    Frames are rendered on a multiprocessing pool, every worker process loads its own copy of the level
+    
+    Usage:
+        python3 render.py levels/Maze.level --pose 1.5 1.5 0 --pose 4.5 1.5 90 --resolution 3840 2880
+        python3 render.py levels/Maze.level --poses poses.json --format npy --processes 8
+    
+    A poses file is a json list of [x, y, direction] lists, if no poses are given the player's pose is used
+'''
+
+import os
+
+#Level used by the current worker process
+_level = None
+
+def initialize(path):
+    '''
+    Description:
+        Sets up pygame without a display and loads the level, called once in every worker process
+    
+    Parameters:
+        path: The path of the level to render
+    '''
+    
+    global _level
+    
+    #Set up pygame without a window before everything else because of dependencies
+    import headless
+    headless.initialize()
+    
+    import world
+    _level = world.Level(path)
+
+def renderFrame(job):
+    '''
+    Description:
+        Renders a single frame and saves it
+    
+    Parameters:
+        job: A tuple (path, pose, resolution, quality, format), pose is (x, y, direction) and format is "png" or "npy"
+    
+    Returns:
+        The path the frame was saved to
+    '''
+    
+    import pygame
+    import pygame.surfarray
+    import numpy
+    import graphic
+    from constants import G_FOV
+    
+    path, pose, resolution, quality, format = job
+    
+    _level.player.x, _level.player.y, _level.player.direction = pose
+    
+    surface = pygame.Surface(resolution)
+    graphic.render3D(surface, _level, G_FOV, quality)
+    
+    if format == "npy":
+        #Raw pixels indexed [y, x, channel]
+        numpy.save(path, pygame.surfarray.array3d(surface).swapaxes(0, 1))
+    else:
+        pygame.image.save(surface, path)
+    
+    return path
+
+def renderLevel(path, poses, resolution, quality=1, format="png", output="renders", processes=None):
+    '''
+    Description:
+        Renders a frame of a level for every camera pose
+    
+    Parameters:
+        path: The path of the level to render
+        poses: A list of camera poses (x, y, direction)
+        resolution: The size of every frame (width, height)
+        quality: The width of each vertical stripe, see graphic.render3D()
+        format: "png" for images or "npy" for raw pixel arrays
+        output: The folder the frames are saved in
+        processes: The amount of worker processes, defaults to the amount of cores
+    
+    Returns:
+        A list of the paths of the saved frames, in the same order as the poses
+    '''
+    
+    import multiprocessing
+    
+    if not os.path.isdir(output):
+        os.makedirs(output)
+    
+    name = os.path.split(path)[1].split(".")[0]
+    jobs = [(os.path.join(output, "%s_%04d.%s" % (name, position, format)), tuple(pose), tuple(resolution), quality, format) for position, pose in enumerate(poses)]
+    
+    pool = multiprocessing.Pool(processes, initialize, (path,))
+    try:
+        #Frames are independent, so hand them out a few at a time
+        return pool.map(renderFrame, jobs, max(1, len(jobs) // ((processes or os.cpu_count() or 1) * 4)))
+    finally:
+        #Let the workers exit by themselves, SDL catches the signal that terminate() sends
+        pool.close()
+        pool.join()
+
+def start(arguments=None):
+    import argparse
+    import json
+    
+    parser = argparse.ArgumentParser(description="Render frames of a level without opening a window")
+    parser.add_argument("level", help="the level file to render")
+    parser.add_argument("--pose", nargs=3, type=float, action="append", default=[], metavar=("X", "Y", "DIRECTION"), help="a camera pose, can be used more than once")
+    parser.add_argument("--poses", help="a json file with a list of [x, y, direction] camera poses")
+    parser.add_argument("--resolution", nargs=2, type=int, default=(1280, 960), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--quality", type=int, default=1, help="the width of each vertical stripe")
+    parser.add_argument("--format", choices=("png", "npy"), default="png")
+    parser.add_argument("--output", default="renders", help="the folder to save frames in")
+    parser.add_argument("--processes", type=int, default=None, help="the amount of worker processes, defaults to the amount of cores")
+    arguments = parser.parse_args(arguments)
+    
+    poses = list(arguments.pose)
+    if arguments.poses is not None:
+        with open(arguments.poses, 'r') as posesfile:
+            poses += json.load(posesfile)
+    
+    if not poses:
+        #Use the player's pose from the level
+        import file
+        poses = [file.loadLevel(arguments.level)['player'][:3]]
+    
+    for path in renderLevel(arguments.level, poses, arguments.resolution, arguments.quality, arguments.format, arguments.output, arguments.processes):
+        print(path)
+
+if __name__ == "__main__":
+    start()
@@ -52,22 +52,80 @@ def changeRenderquality():
     if renderqualitysetting >= len(renderqualityoptions):
         renderqualitysetting = 0
 
+#List of render band options, list of integers
+renderbandoptions = (1, 2, 4, 8, 16)
+#Current render band setting, defaults to 0, (1)
+renderbandsetting = 0
+
+def renderbands():
+    '''
+    Returns the amount of vertical bands the 3d view is split into (Integer), at least one for every render thread
+    '''
+    
+    #Every thread needs a band of its own, otherwise extra threads are never used
+    return max(renderbandoptions[renderbandsetting], renderthreads())
+
+def changeRenderbands():
+    '''
+    Increases the current render band setting option by 1, when it reaches the limit it resets
+    '''
+    
+    #Use the global render band setting variable
+    global renderbandsetting
+    
+    #Add 1 to current render band setting
+    renderbandsetting += 1
+    #If the render band setting is out of the option range, reset to 0
+    if renderbandsetting >= len(renderbandoptions):
+        renderbandsetting = 0
+
+#List of render thread options, list of integers
+renderthreadoptions = (1, 2, 4, 8)
+#Current render thread setting, defaults to 0, (1)
+renderthreadsetting = 0
+
+def renderthreads():
+    '''
+    Returns the amount of threads used to render bands (Integer)
+    '''
+    
+    return renderthreadoptions[renderthreadsetting]
+
+def changeRenderthreads():
+    '''
+    Increases the current render thread setting option by 1, when it reaches the limit it resets
+    '''
+    
+    #Use the global render thread setting variable
+    global renderthreadsetting
+    
+    #Add 1 to current render thread setting
+    renderthreadsetting += 1
+    #If the render thread setting is out of the option range, reset to 0
+    if renderthreadsetting >= len(renderthreadoptions):
+        renderthreadsetting = 0
+
 def saveSettings():
     '''
-    Saves the resolution and render quality setting to core/Settings.json
+    Saves the resolution, render quality, render band and render thread setting to core/Settings.json
     '''
     
-    file.saveJson("core/Settings.json", {'resolution' : resolutionsetting, 'renderquality' : renderqualitysetting})
+    file.saveJson("core/Settings.json", {'resolution' : resolutionsetting, 'renderquality' : renderqualitysetting, 'renderbands' : renderbandsetting, 'renderthreads' : renderthreadsetting})
 
 def loadSettings():
     '''
-    Loads the resolution and render quality setting from core/Settings.json
+    Loads the resolution, render quality, render band and render thread setting from core/Settings.json
     '''
     
     global resolutionsetting
     global renderqualitysetting
+    global renderbandsetting
+    global renderthreadsetting
     
     data = file.loadJson("core/Settings.json")
     if data is not None:
         resolutionsetting = data['resolution']
-        renderqualitysetting = data['renderquality']
\ No newline at end of file
+        renderqualitysetting = data['renderquality']
+        #Older settings files do not have band and thread settings
+        renderbandsetting = data.get('renderbands', 0)
+        renderthreadsetting = data.get('renderthreads', 0)
\ No newline at end of file
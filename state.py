@@ -1,4 +1,4 @@
-from constants import F_TITLE, F_BIG, F_REGULAR, M_BUTTONDIMENSIONS, M_BUTTONSPACING, M_OFFSET, L_ESCAPE, G_FOV, P_ROTATIONSPEED
+from constants import F_TITLE, F_BIG, F_REGULAR, M_BUTTONDIMENSIONS, M_BUTTONSPACING, M_OFFSET, L_ESCAPE, G_FOV
 from pygame.locals import MOUSEMOTION, MOUSEBUTTONDOWN, K_TAB, K_LSHIFT, K_w, K_a, K_s, K_d, K_o, K_p, K_SPACE
 import pygame
 import graphic
@@ -10,6 +10,7 @@ import world
 import utility
 import file
 import editor
+import catalog
 
 class StateManager(object):
     def __init__(self, defaultstate, states):
@@ -26,7 +27,14 @@ class StateManager(object):
                 enable(): Called when the state gains focus
                 disable(newstate): Called when the state loses focus, the newstate is the state that is gaining focus afterwards
                 update(surface, delta, events, keys, mousepos): Called every update in the main lo
-                
+            
+            A state class can also include these methods:
+                simulate(delta, keys): Called zero or more times a frame with a fixed delta, before update
+                interpolate(alpha): Called once a frame before update, alpha is how far the frame is between the last two simulation steps
+            
+            Update can return a list of the rectangles it changed, an empty list if nothing changed, or None if the
+            whole surface could have changed. States that return rectangles have a redraw variable, when it is true
+            the state draws everything in its next update and returns None, see redraw()
         '''
         
         #Link all states to current state manager
@@ -58,8 +66,22 @@ class StateManager(object):
         self.lastState, self.currentState = self.currentState, self.lastState
         self.getCurrentState().enable()
     
+    def simulate(self, delta, keys):
+        if hasattr(self.getCurrentState(), "simulate"):
+            self.getCurrentState().simulate(delta, keys)
+    
+    def interpolate(self, alpha):
+        if hasattr(self.getCurrentState(), "interpolate"):
+            self.getCurrentState().interpolate(alpha)
+    
+    def redraw(self):
+        #Makes the current state draw everything in its next update
+        if hasattr(self.getCurrentState(), "redraw"):
+            self.getCurrentState().redraw = True
+    
     def update(self, surface, delta, events, keys):
-        self.getCurrentState().update(surface, delta, events, keys)
+        #Returns the rectangles the state changed, or None if the whole surface could have changed
+        return self.getCurrentState().update(surface, delta, events, keys)
 
 class Main(object):
     name = "Main"
@@ -67,6 +89,9 @@ class Main(object):
     def __init__(self):
         self.level = world.Level("core/Menu.level")
         
+        #The menu level is only turned, so it is drawn from a panorama, Settings uses it too
+        self.panorama = graphic.Panorama(self.level, G_FOV, setting.renderquality())
+        
         self.title = gui.AlignedLabel(F_TITLE, "Raycaster", True, (238, 238, 238), 1, (setting.resolution()[0] / 2, setting.resolution()[1] / 4), M_OFFSET)
         self.menu = gui.TextMenu(setting.resolution(), F_REGULAR, M_BUTTONDIMENSIONS, M_BUTTONSPACING, M_OFFSET,[
                             ("START GAME", (255, 193, 7), (255, 202, 40)),
@@ -80,6 +105,7 @@ class Main(object):
         #Check dimensions
         self.title.setLocation((setting.resolution()[0] / 2, setting.resolution()[1] / 4))
         self.menu.setDimensions(M_BUTTONDIMENSIONS, setting.resolution(), M_BUTTONSPACING, M_OFFSET)
+        self.panorama.linewidth = setting.renderquality()
     
     def disable(self, newstate=None):
         None
@@ -105,9 +131,7 @@ class Main(object):
             elif event.type == MOUSEMOTION:
                 self.selected = self.menu.update(event.pos)
         
-        
-        
-        graphic.render3D(surface, self.level, G_FOV, setting.renderquality())
+        self.panorama.render(surface)
         self.title.render(surface)
         self.menu.render(surface)
 
@@ -119,12 +143,14 @@ class Settings(object):
         self.menu = gui.TextMenu(setting.resolution(), F_REGULAR, M_BUTTONDIMENSIONS, M_BUTTONSPACING, M_OFFSET,[
                             ("RESOLUTION: " + str(setting.resolution()), (76, 175, 80), (102, 187, 106)),
                             ("RENDER QUALITY: " + str(setting.renderquality()), (76, 175, 80), (102, 187, 106)),
+                            ("RENDER THREADS: " + str(setting.renderthreads()), (76, 175, 80), (102, 187, 106)),
                             ("BACK", (244, 67, 54), (239, 83, 80))
                             ])
         self.selected = ""
     
     def enable(self):
         self.level = self.manager.getState("Main").level
+        self.panorama = self.manager.getState("Main").panorama
     
     def disable(self, newstate=None):
         None
@@ -148,13 +174,19 @@ class Settings(object):
                     setting.changeRenderquality()
                     
                     self.menu.getButton(1).setText("RENDER QUALITY: " + str(setting.renderquality()))
+                    self.panorama.linewidth = setting.renderquality()
                 
                 elif self.selected == 2:
+                    setting.changeRenderthreads()
+                    
+                    self.menu.getButton(2).setText("RENDER THREADS: " + str(setting.renderthreads()))
+                
+                elif self.selected == 3:
                     self.manager.swapState()
             elif event.type == MOUSEMOTION:
                 self.selected = self.menu.update(event.pos)
         
-        graphic.render3D(surface, self.level, G_FOV, setting.renderquality())
+        self.panorama.render(surface)
         self.title.render(surface)
         self.menu.render(surface)
 
@@ -164,35 +196,29 @@ class Selector(object):
     def __init__(self):
         self.title = gui.AlignedLabel(F_TITLE, "Level Select", True, (238, 238, 238), 1, (setting.resolution()[0] / 2, setting.resolution()[1] / 4), M_OFFSET)
         
-        self.dictionaries = []
-        
-        #Scan for levels then add them as buttons
+        #Scan for levels then add them as buttons, only the metadata is read, levels are loaded when they are picked
+        self.catalog = catalog.Catalog("levels/")
+        self.levels = self.catalog.update()
         buttons = []
-        for fileName in file.listContents("levels/"):
-            if fileName.split(".")[1] == "level":
-                data = file.loadJson("levels/" + fileName)
-                
-                self.dictionaries += [(data['name'], data)]
-                buttons += [(data['name'], (63, 81, 181), (92, 107, 192))]
+        for entry in self.levels:
+            buttons += [(entry['name'], (63, 81, 181), (92, 107, 192))]
         #Add a back butotn
         buttons += [("BACK", (244, 67, 54), (239, 83, 80))]
         
         self.menu = gui.TextMenu(setting.resolution(), F_REGULAR, M_BUTTONDIMENSIONS, M_BUTTONSPACING, M_OFFSET, buttons)
         self.levelSelected = None
         self.selected = ""
+        self.redraw = True
     
     def enable(self):
         self.title.setLocation((setting.resolution()[0] / 2, setting.resolution()[1] / 4))
         self.menu.setDimensions(M_BUTTONDIMENSIONS, setting.resolution(), M_BUTTONSPACING, M_OFFSET)
+        self.redraw = True
     
     def disable(self, newstate=None):
         #When this state is disabled, if the new state is play then load the current world
-        if newstate.name == "Play":
-            for dictionary in self.dictionaries:
-                if dictionary[0] == self.levelSelected:
-                    newstate.level = world.Level(dictionary[1])
-                    break
-                
+        if newstate.name == "Play" and self.levelSelected is not None:
+            newstate.level = world.Level(self.catalog.getPath(self.levels[self.levelSelected]))
     
     def update(self, surface, delta, events, keys):
         #Pausese if escape is clicked
@@ -201,18 +227,23 @@ class Selector(object):
             self.manager.swapState()
             return
         
-        surface.fill((13, 13, 13))
-        
         for event in events:
             if event.type == MOUSEBUTTONDOWN and event.button == 1 and self.selected is not None:
                 if self.selected == self.menu.getSize() - 1:
                     self.manager.swapState()
                 else:
-                    self.levelSelected = self.menu.getButton(self.selected).getText()
+                    self.levelSelected = self.selected
                     self.manager.setState("Play")
+                    return
             elif event.type == MOUSEMOTION:
                 self.selected = self.menu.update(event.pos)
         
+        #Only buttons that changed highlight are drawn again, unless everything has to be
+        if not self.redraw:
+            return self.menu.renderChanged(surface)
+        self.redraw = False
+        
+        surface.fill((13, 13, 13))
         self.title.render(surface)
         self.menu.render(surface)
 
@@ -221,6 +252,7 @@ class Play(object):
     
     def __init__(self, level = None):
         self.level = level
+        self.alpha = 1
         
         #Game variables
         self.player = file.loadImage("core/tex/player.png")
@@ -240,9 +272,21 @@ class Play(object):
         
         if newstate is not None and newstate.name == "Pause":
             snapshot = pygame.Surface(setting.resolution())
-            graphic.render3D(snapshot, self.level, G_FOV, setting.renderquality())
+            graphic.render3D(snapshot, self.level, G_FOV, setting.renderquality(), setting.renderbands(), setting.renderthreads())
             newstate.screen = snapshot
     
+    def simulate(self, delta, keys):
+        #Remember positions before anything moves, used for interpolation
+        self.level.remember()
+        
+        #Moves the camera with W, A, S and D, rotates it with O and P, sprints with shift and shoots with space
+        self.level.player.control(keys[K_w] - keys[K_s], keys[K_d] - keys[K_a], keys[K_p] - keys[K_o], keys[K_LSHIFT], keys[K_SPACE], delta)
+        
+        self.level.update(delta)
+    
+    def interpolate(self, alpha):
+        self.alpha = alpha
+    
     def update(self, surface, delta, events, keys):
         mousepos = pygame.mouse.get_pos()
         
@@ -251,34 +295,6 @@ class Play(object):
         if L_ESCAPE.isClicked():
             self.manager.setState("Pause")
             return
-               
-        currentSpeed = 0
-        
-        if keys[K_LSHIFT]:
-            #Sets the current move speed to 6 (Sprint)
-            currentSpeed = self.level.player.sprintspeed
-        else:
-            currentSpeed = self.level.player.speed
-        
-        if keys[K_w] and not keys[K_s]:
-            #Moves the camera forward
-            self.level.player.walk(currentSpeed * delta)
-        if keys[K_s] and not keys[K_w]:
-            #Moves the camera backward
-            self.level.player.walk(-currentSpeed * delta)
-        if keys[K_d] and not keys[K_a]:
-            #Moves the camera right
-            self.level.player.strafe(currentSpeed * delta)
-        if keys[K_a] and not keys[K_d]:
-            #Moves the camera left
-            self.level.player.strafe(-currentSpeed * delta)
-        
-        if keys[K_o] and not keys[K_p]:
-            #Rotates the camera left
-            self.level.player.rotate(-P_ROTATIONSPEED * delta)
-        if keys[K_p] and not keys[K_o]:
-            #Rotates the camera right
-            self.level.player.rotate(P_ROTATIONSPEED * delta)
         
         #Rotate camera based on the mouse distance from middle (Only uses X delta)
         self.level.player.rotate((mousepos[0] - setting.resolution()[0] / 2) * 0.1)
@@ -286,13 +302,8 @@ class Play(object):
         #Moves the mouse to the middle of the window which resets the relative mouse movement
         pygame.mouse.set_pos((setting.resolution()[0] / 2, setting.resolution()[1] / 2))
         
-        if keys[K_SPACE]:
-            self.level.player.shoot(self.level)
-        
-        self.level.update(delta)
-        
-        #Renders raycast on display surface
-        graphic.render3D(surface, self.level, G_FOV, setting.renderquality())
+        #Renders raycast on display surface, moving entities are drawn between the last two simulation steps
+        graphic.render3D(surface, self.level, G_FOV, setting.renderquality(), setting.renderbands(), setting.renderthreads(), self.alpha)
         graphic.renderHealth(surface, (5, surface.get_height() - 35, 106, 30), self.level, self.bar, self.health)
         
         #If tab is being pressed, render the 2d map
@@ -304,6 +315,7 @@ class Pause(object):
     
     def __init__(self):
         self.screen = pygame.Surface(setting.resolution())
+        self.redraw = True
         
         self.title = gui.AlignedLabel(F_TITLE, "PAUSED", True, (238, 238, 238), 1, (setting.resolution()[0] / 2, setting.resolution()[1] / 4), M_OFFSET)
         self.menu = gui.TextMenu(setting.resolution(), F_REGULAR, M_BUTTONDIMENSIONS, M_BUTTONSPACING, M_OFFSET,[
@@ -317,6 +329,7 @@ class Pause(object):
     def enable(self):
         self.title.setLocation((setting.resolution()[0] / 2, setting.resolution()[1] / 4))
         self.menu.setDimensions(M_BUTTONDIMENSIONS, setting.resolution(), M_BUTTONSPACING, M_OFFSET)
+        self.redraw = True
     
     def disable(self, newstate=None):
         pass
@@ -338,9 +351,15 @@ class Pause(object):
                 
                 elif self.selected == 2:
                     self.manager.setState("Main")
+                return
             elif event.type == MOUSEMOTION:
                 self.selected = self.menu.update(event.pos)
         
+        #Only buttons that changed highlight are drawn again, unless everything has to be
+        if not self.redraw:
+            return self.menu.renderChanged(surface)
+        self.redraw = False
+        
         surface.blit(pygame.transform.scale(self.screen, surface.get_rect().size), (0, 0))
         self.title.render(surface)
         self.menu.render(surface)
@@ -377,13 +396,24 @@ class Editor():
         self.toolselector = editor.ToolSelector((0, 495, 530, 35), F_REGULAR, self.mapeditor)
         
         self.selected = ""
+        self.redraw = True
     
     def enable(self):
         pygame.display.set_mode((760, 530))
+        self.redraw = True
     
     def disable(self, newstate=None):
         pygame.display.set_mode(setting.resolution())
     
+    def simulate(self, delta, keys):
+        #Only the test level is simulated
+        if self.play is not None:
+            self.play.simulate(delta, keys)
+    
+    def interpolate(self, alpha):
+        if self.play is not None:
+            self.play.interpolate(alpha)
+    
     def update(self, surface, delta, events, keys):
         L_ESCAPE.update(keys)
         if L_ESCAPE.isClicked():
@@ -399,7 +429,18 @@ class Editor():
             self.play.update(surface, delta, events, keys)
             return
         
+        #Parts of the editor that have to be drawn again, mouse movement that stays inside the map editor only changes the map editor
+        mapchanged = False
+        
         for event in events:
+            if event.type == MOUSEBUTTONDOWN:
+                self.redraw = True
+            elif event.type == MOUSEMOTION:
+                if self.mapeditor.rect.collidepoint(event.pos) and self.mapeditor.rect.collidepoint(event.pos[0] - event.rel[0], event.pos[1] - event.rel[1]):
+                    mapchanged = True
+                else:
+                    self.redraw = True
+            
             if event.type == MOUSEBUTTONDOWN and event.button == 1:
                 if self.back.selected:
                     self.manager.swapState()
@@ -495,7 +536,7 @@ class Editor():
                             packname = easygui.choicebox("Select a pack from the list below.\nIf you want to install a new pack, move it into the \"pack\" folder next to the executable.", "Change pack", pack.listPacks())
                             
                             if packname is not None:
-                                self.level.pack = pack.Pack(packname)
+                                self.level.setPack(packname)
                                 self.packselector.setPack(self.level.pack)
                                 self.packlabel.setText(self.level.pack.name)
                         
@@ -533,6 +574,17 @@ class Editor():
                 self.brush = self.packselector.update(event.pos)
                 self.tool = self.toolselector.update(event.pos)
         
+        if self.play is not None or self.manager.getCurrentState() is not self:
+            #Testing started or the state changed, the editor is not drawn anymore
+            return
+        
+        if not self.redraw:
+            if mapchanged:
+                self.mapeditor.render(surface)
+                return [self.mapeditor.rect]
+            return []
+        self.redraw = False
+        
         pygame.draw.rect(surface, (33, 33, 33), self.topbar)
         pygame.draw.rect(surface, (238, 238, 238), self.sidebar)
         
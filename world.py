@@ -1,5 +1,7 @@
-from constants import W_WALLDIST
+from constants import W_WALLDIST, W_COLUMNTHRESHOLD, W_PROJECTILEPOOL, W_FLOWRANGE, W_SIGHTCACHESIZE, P_ROTATIONSPEED
 import math
+import weakref
+import numpy
 import file
 import pack
 
@@ -7,10 +9,40 @@ class Level(object):
     def __init__(self, info=None):
         self.finished = False
         
+        #Incremented every time the map changes, used to keep map caches up to date
+        self.revision = 0
+        
+        #Spatial index of statics, items, enemies and projectiles, one dictionary of tile buckets for every variation
+        self.buckets = ({}, {}, {}, {})
+        
+        #Columnar storage of enemies and projectiles, see useColumns()
+        self.columns = None
+        
+        #Removed projectiles that can be reused
+        self.projectilepool = []
+        
+        #Distances to the player's tile in a square around the player, see updateFlow()
+        self.flowfield = None
+        self.flowlist = None
+        self.flowx = 0
+        self.flowy = 0
+        self.flowkey = None
+        
+        #Line of sight between pairs of tiles, see canSee()
+        self.sightcache = {}
+        self.sightrevision = -1
+        
+        #Cached walls of the minimap, see graphic.render2D()
+        self.minimap = None
+        
+        #Shared pack, given back when the level is collected, see setPack()
+        self.pack = None
+        self.packfinalizer = None
+        
         if info is not None:
-            #Load level by string or by dictionary
+            #Load level by string or by dictionary, files can be json or binary
             if isinstance(info, str):
-                data = file.loadJson(info)
+                data = file.loadLevel(info)
             elif isinstance(info, dict):
                 data = info
             
@@ -19,9 +51,14 @@ class Level(object):
             self.ceilingcolor = data['ceilingcolor']
             self.floorcolor = data['floorcolor']
             self.outerwall = data['outerwall']
-            self.pack = pack.Pack(data['pack'])
+            self.setPack(data['pack'])
+            
+            self.loadMap(data['map'])
             
-            self.map = data['map']
+            #Build the textures the level uses while the rest of it loads
+            sprites = {(0, static[2]) for static in data['statics']} | {(1, item[2]) for item in data['items']}
+            sprites |= {(2, enemy[3]) for enemy in data['enemies']} | {(3, enemy[9]) for enemy in data['enemies']} | {(3, data['player'][10])}
+            self.pack.warm(numpy.flatnonzero(numpy.bincount(self.map.ravel())).tolist() + [self.outerwall], sprites)
             
             player = data['player']
             self.player = Player(player[0], player[1], player[2], player[3], player[4], player[5], player[6], player[7], player[8], player[9], player[10])
@@ -46,7 +83,7 @@ class Level(object):
             self.ceilingcolor = (235, 235, 235)
             self.floorcolor = (75, 75, 75)
             self.outerwall = 1
-            self.pack = pack.Pack("Dungeon")
+            self.setPack("Dungeon")
             
             self.loadEmpty(10, 10)
             
@@ -57,74 +94,275 @@ class Level(object):
             self.enemies = []
             self.projectiles = []
     
-    def getDictionary(self):
+    def getDictionary(self, maparray=False):
+        #The map is a list of rows, or the numpy array itself if maparray is true
         return {"name": self.name,
                 "ceilingcolor": self.ceilingcolor,
                 "floorcolor": self.floorcolor,
                 "outerwall": self.outerwall,
                 "pack": self.pack.name,
-                "map": self.map,
+                "map": self.map if maparray else self.map.tolist(),
                 "player": (self.player.x, self.player.y, self.player.direction, self.player.speed, self.player.sprintspeed, self.player.health, self.player.regen, self.player.cooldown, self.player.projectilespeed, self.player.projectiledamage, self.player.projectiletexture),
                 "statics": list(map(lambda static: (static.x, static.y, static.texture), self.statics)),
                 "items": list(map(lambda item: (item.x, item.y, item.texture, item.function), self.items)),
                 "enemies": list(map(lambda enemy: (enemy.x, enemy.y, enemy.direction, enemy.texture, enemy.speed, enemy.health, enemy.cooldown, enemy.projectilespeed, enemy.projectiledamage, enemy.projectiletexture), self.enemies))}
     
+    def setPack(self, name):
+        #Switches to the shared pack with a name, the old pack is given back
+        if self.packfinalizer is not None:
+            self.packfinalizer()
+        
+        self.pack = pack.acquire(name)
+        self.packfinalizer = weakref.finalize(self, pack.release, self.pack)
+    
     def copy(self):
         return Level(self.getDictionary())
     
-    def save(self, path):
-        file.saveJson(path, self.getDictionary())
+    def save(self, path, binary=False):
+        file.saveLevel(path, self.getDictionary(binary), binary)
     
     def changeSize(self, width, height):
-        currentWidth = self.getWidth()
-        currentHeight = self.getHeight()
-        
-        if height != currentHeight:
-            if height < currentHeight:
-                del self.map[height:]
-            else:
-                self.map += [[0 for _ in range(width)] for _ in range(height - currentHeight)]
-        
-        if width != currentWidth:
-            if width < currentWidth:
-                for stripe in self.map:
-                    del stripe[width:]
-            else:
-                for stripe in self.map:
-                    stripe += [0 for _ in range(width - currentWidth)]
+        #Keeps the tiles that fit in the new size, new tiles are empty
+        tiles = numpy.zeros((height, width), numpy.uint16)
+        tiles[:min(height, self.height), :min(width, self.width)] = self.map[:height, :width]
+        self.setMap(tiles)
         
         for sprite in self.statics + self.items + self.enemies + self.projectiles:
             if sprite.x > width or sprite.y > height:
                 self.removeEntity(sprite)
     
     def loadEmpty(self, width, height):
-        self.map = [[0 for _ in range(width)] for _ in range(height)]
+        self.setMap(numpy.zeros((height, width), numpy.uint16))
+    
+    def loadMap(self, rows):
+        #Loads the map from a list of rows, rows can be longer than the first row in older levels, those tiles are never used
+        if isinstance(rows, numpy.ndarray):
+            #Memory mapped maps are used without copying
+            self.setMap(rows.astype(numpy.uint16, copy=False))
+            return
+        
+        width = len(rows[0])
+        tiles = numpy.zeros((len(rows), width), numpy.uint16)
+        for y, row in enumerate(rows):
+            tiles[y, :len(row[:width])] = row[:width]
+        self.setMap(tiles)
+    
+    def setMap(self, tiles):
+        '''
+        Replaces the map with a 2d numpy array of tiles indexed [y, x]
+        The size is cached and the tiles can also be read through a flat memoryview, which gives python ints
+        '''
+        self.map = numpy.ascontiguousarray(tiles, numpy.uint16)
+        self.height, self.width = self.map.shape
+        self.tiles = memoryview(self.map.reshape(-1))
+        self.revision += 1
     
     def getWidth(self):
-        return len(self.map[0])
+        return self.width
     
     def getHeight(self):
-        return len(self.map)
+        return self.height
     
     def inBounds(self, x, y):
-        return (0 <= x < self.getWidth() and 0 <= y < self.getHeight())
+        return (0 <= x < self.width and 0 <= y < self.height)
     
     def setElement(self, x, y, value):
         #Check to see if the requested x and y values are inside the map
-        if self.inBounds(x, y):
-            self.map[y][x] = value
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.tiles[y * self.width + x] = value
+            self.revision += 1
             return True
         return False
     
     def getElement(self, x, y):
         #Check to see if the requested x and y values are inside the map
-        if self.inBounds(x, y):
-            return self.map[y][x]
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.tiles[y * self.width + x]
         return self.outerwall
     
+    def getTile(self, x, y):
+        #Same as getElement() without checking if the position is inside the map, only use with positions that are
+        return self.tiles[y * self.width + x]
+    
+    def getGrid(self):
+        #The map indexed [y, x], must not be changed directly
+        return self.map
+    
     def getRelativeElement(self, x, y, deltaX, deltaY):
         return self.getElement(math.floor(x + deltaX), math.floor(y + deltaY))
     
+    def updateFlow(self):
+        '''
+        Finds the walking distance from every tile within W_FLOWRANGE tiles of the player to the player's tile
+        Steps can be diagonal if both tiles beside the step are empty, walls and unreachable tiles are -1
+        Only recomputed when the player changes tiles or the map changes
+        '''
+        cellX = math.floor(self.player.x)
+        cellY = math.floor(self.player.y)
+        if self.flowkey == (cellX, cellY, self.revision):
+            return
+        self.flowkey = (cellX, cellY, self.revision)
+        
+        size = W_FLOWRANGE * 2 + 1
+        self.flowx = cellX - W_FLOWRANGE
+        self.flowy = cellY - W_FLOWRANGE
+        
+        #Empty tiles of the square, padded by a tile of walls on every side
+        grid = self.getGrid()
+        empty = numpy.full((size + 2, size + 2), self.outerwall == 0)
+        empty[0, :] = empty[-1, :] = empty[:, 0] = empty[:, -1] = False
+        left, top = max(0, self.flowx), max(0, self.flowy)
+        right, bottom = min(grid.shape[1], self.flowx + size), min(grid.shape[0], self.flowy + size)
+        if left < right and top < bottom:
+            empty[top - self.flowy + 1:bottom - self.flowy + 1, left - self.flowx + 1:right - self.flowx + 1] = grid[top:bottom, left:right] == 0
+        
+        inner = empty[1:-1, 1:-1]
+        field = numpy.full((size, size), -1, numpy.int32)
+        
+        if inner[W_FLOWRANGE, W_FLOWRANGE]:
+            #Tiles that can step to each neighbour
+            steps = []
+            for offsetX, offsetY in FLOWOFFSETS:
+                step = inner & empty[1 + offsetY:size + 1 + offsetY, 1 + offsetX:size + 1 + offsetX]
+                if offsetX and offsetY:
+                    step &= empty[1:-1, 1 + offsetX:size + 1 + offsetX] & empty[1 + offsetY:size + 1 + offsetY, 1:-1]
+                steps.append(step)
+            
+            #Grow outwards from the player's tile one step at a time, every step handles the whole square at once
+            #Winding paths are cut off after a few times the range, enemies that far away go straight to the player
+            frontier = numpy.zeros((size + 2, size + 2), bool)
+            frontier[W_FLOWRANGE + 1, W_FLOWRANGE + 1] = True
+            field[W_FLOWRANGE, W_FLOWRANGE] = 0
+            distance = 0
+            while distance < W_FLOWRANGE * 4:
+                reached = numpy.zeros((size, size), bool)
+                for (offsetX, offsetY), step in zip(FLOWOFFSETS, steps):
+                    reached |= step & frontier[1 + offsetY:size + 1 + offsetY, 1 + offsetX:size + 1 + offsetX]
+                reached &= field == -1
+                if not reached.any():
+                    break
+                distance += 1
+                field[reached] = distance
+                frontier[1:-1, 1:-1] = reached
+        
+        self.flowfield = numpy.pad(field, 1, constant_values=-1)
+        #Plain lists are faster to read one tile at a time
+        self.flowlist = self.flowfield.tolist()
+    
+    def getFlowAngle(self, x, y):
+        '''
+        Finds the direction to walk in from a position to get to the player, see updateFlow()
+        Goes straight to the player if the player is a tile away or there is no known way
+        '''
+        player = self.player
+        angle = math.degrees(math.atan2(player.y - y, player.x - x))
+        if self.flowlist is None:
+            return angle
+        
+        cellX = math.floor(x)
+        cellY = math.floor(y)
+        #The field is padded by a tile, so neighbours of tiles in the square can always be read
+        fieldX = cellX - self.flowx + 1
+        fieldY = cellY - self.flowy + 1
+        size = len(self.flowlist) - 2
+        if not (1 <= fieldX <= size and 1 <= fieldY <= size):
+            return angle
+        
+        field = self.flowlist
+        distance = field[fieldY][fieldX]
+        if distance <= 1:
+            return angle
+        
+        #Step to the neighbour closer to the player, ties go to the one nearest to the player
+        best = None
+        for offsetX, offsetY in FLOWOFFSETS:
+            if field[fieldY + offsetY][fieldX + offsetX] == distance - 1 and (field[fieldY][fieldX + offsetX] >= 0 and field[fieldY + offsetY][fieldX] >= 0):
+                score = (cellX + offsetX + 0.5 - player.x) ** 2 + (cellY + offsetY + 0.5 - player.y) ** 2
+                if best is None or score < best[0]:
+                    best = (score, cellX + offsetX, cellY + offsetY)
+        
+        if best is None:
+            return angle
+        return math.degrees(math.atan2(best[2] + 0.5 - y, best[1] + 0.5 - x))
+    
+    def canSee(self, x, y, targetX, targetY):
+        '''
+        Checks if there are no walls on the line between the centres of the tiles of two positions
+        Results are cached for every pair of tiles until the map changes
+        '''
+        if self.sightrevision != self.revision or len(self.sightcache) >= W_SIGHTCACHESIZE:
+            self.sightcache.clear()
+            self.sightrevision = self.revision
+        
+        key = (math.floor(x), math.floor(y), math.floor(targetX), math.floor(targetY))
+        visible = self.sightcache.get(key)
+        if visible is None:
+            visible = self.sightcache[key] = self.traceSight(*key)
+        return visible
+    
+    def traceSight(self, cellX, cellY, targetX, targetY):
+        #Walks the tiles between the centres of two tiles like graphic.castRay(), stops at the first wall
+        rayDirX = targetX - cellX
+        rayDirY = targetY - cellY
+        
+        #Distance along the line between grid lines on each axis, the line starts in the middle of a tile
+        deltaDistX = abs(1 / rayDirX) if rayDirX != 0 else math.inf
+        deltaDistY = abs(1 / rayDirY) if rayDirY != 0 else math.inf
+        sideDistX = deltaDistX / 2
+        sideDistY = deltaDistY / 2
+        stepX = 1 if rayDirX > 0 else -1
+        stepY = 1 if rayDirY > 0 else -1
+        
+        #Every tile on the line is inside the map if both ends are
+        getTile = self.getTile if self.inBounds(cellX, cellY) and self.inBounds(targetX, targetY) else self.getElement
+        
+        #The target is reached after one step for every tile on each axis
+        for _ in range(abs(rayDirX) + abs(rayDirY) - 1):
+            if sideDistX < sideDistY:
+                sideDistX += deltaDistX
+                cellX += stepX
+            else:
+                sideDistY += deltaDistY
+                cellY += stepY
+            
+            if cellX == targetX and cellY == targetY:
+                break
+            if getTile(cellX, cellY) != 0:
+                return False
+        return True
+    
+    def getFlowAngles(self, x, y):
+        #Same as getFlowAngle() for arrays of positions
+        player = self.player
+        angles = numpy.degrees(numpy.arctan2(player.y - y, player.x - x))
+        if self.flowfield is None:
+            return angles
+        
+        field = self.flowfield
+        size = field.shape[0] - 2
+        cellX = numpy.floor(x).astype(int)
+        cellY = numpy.floor(y).astype(int)
+        fieldX = cellX - self.flowx + 1
+        fieldY = cellY - self.flowy + 1
+        rows = numpy.flatnonzero((fieldX >= 1) & (fieldX <= size) & (fieldY >= 1) & (fieldY <= size))
+        rows = rows[field[fieldY[rows], fieldX[rows]] > 1]
+        if rows.size == 0:
+            return angles
+        
+        cellX, cellY, fieldX, fieldY = cellX[rows, None], cellY[rows, None], fieldX[rows, None], fieldY[rows, None]
+        offsetX = numpy.array([offset[0] for offset in FLOWOFFSETS])
+        offsetY = numpy.array([offset[1] for offset in FLOWOFFSETS])
+        
+        valid = ((field[fieldY + offsetY, fieldX + offsetX] == field[fieldY, fieldX] - 1) &
+                 (field[fieldY, fieldX + offsetX] >= 0) & (field[fieldY + offsetY, fieldX] >= 0))
+        score = numpy.where(valid, (cellX + offsetX + 0.5 - player.x) ** 2 + (cellY + offsetY + 0.5 - player.y) ** 2, numpy.inf)
+        best = score.argmin(1)
+        
+        found = valid.any(1)
+        rows, best = rows[found], best[found]
+        angles[rows] = numpy.degrees(numpy.arctan2(cellY[found, 0] + offsetY[best] + 0.5 - y[rows], cellX[found, 0] + offsetX[best] + 0.5 - x[rows]))
+        return angles
+    
     def addEntity(self, entity):
         if entity.level is None:
             entity.level = self
@@ -136,9 +374,28 @@ class Level(object):
                 self.enemies.append(entity)
             elif entity.variation == 3:
                 self.projectiles.append(entity)
+            if self.columns is not None:
+                self.columns.insert(entity)
+            self.indexEntity(entity)
+            entity.remember()
+    
+    def spawnProjectile(self, x, y, direction, texture, spawn):
+        #Adds a projectile one unit in front of the position, reusing a removed projectile if there is one
+        if self.projectilepool:
+            projectile = self.projectilepool.pop()
+            projectile.__init__(x, y, direction, texture, spawn)
+        else:
+            projectile = Projectile(x, y, direction, texture, spawn)
+        
+        projectile.walk(1, False)
+        self.addEntity(projectile)
+        return projectile
     
     def removeEntity(self, entity):
         if entity is not None:
+            self.unindexEntity(entity)
+            if self.columns is not None:
+                self.columns.release(entity)
             if entity.variation == 0:
                 self.statics.remove(entity)
                 del entity
@@ -150,63 +407,160 @@ class Level(object):
                 del entity
             elif entity.variation == 3:
                 self.projectiles.remove(entity)
-                del entity
+                #Keep removed projectiles so they can be reused by spawnProjectile()
+                if len(self.projectilepool) < W_PROJECTILEPOOL:
+                    entity.level = None
+                    entity.spawn = None
+                    self.projectilepool.append(entity)
+    
+    def indexEntity(self, entity):
+        #Adds an entity to the bucket of the tile it is standing on
+        if 0 <= entity.variation <= 3:
+            entity.cell = (math.floor(entity.x), math.floor(entity.y))
+            self.buckets[entity.variation].setdefault(entity.cell, []).append(entity)
+    
+    def unindexEntity(self, entity):
+        if entity.cell is not None:
+            buckets = self.buckets[entity.variation]
+            bucket = buckets[entity.cell]
+            bucket.remove(entity)
+            if not bucket:
+                del buckets[entity.cell]
+            entity.cell = None
+    
+    def relocateEntity(self, entity):
+        #Must be called after an entity's position changes, only touches the index if the entity changed tiles
+        if entity.cell is not None and entity.cell != (math.floor(entity.x), math.floor(entity.y)):
+            self.unindexEntity(entity)
+            self.indexEntity(entity)
+    
+    def queryAABB(self, x, y, size=0.5, variation=-1):
+        '''
+        Finds every entity of a variation (-1 for all) that is inside a square, see Entity.collideAABB
+        Only checks the buckets of the tiles the square touches, the player is never included
+        '''
+        result = []
+        for buckets in (self.buckets if variation == -1 else (self.buckets[variation],)):
+            for cellX in range(math.floor(x - size), math.floor(x + size) + 1):
+                for cellY in range(math.floor(y - size), math.floor(y + size) + 1):
+                    for entity in buckets.get((cellX, cellY), ()):
+                        if entity.collideAABB(x, y, size):
+                            result.append(entity)
+        return result
+    
+    def queryRadius(self, x, y, radius=0.5, variation=-1):
+        '''
+        Finds every entity of a variation (-1 for all) that is inside a circle, see Entity.collideCircle
+        Only checks the buckets of the tiles the circle touches, the player is never included
+        '''
+        result = []
+        for buckets in (self.buckets if variation == -1 else (self.buckets[variation],)):
+            for cellX in range(math.floor(x - radius), math.floor(x + radius) + 1):
+                for cellY in range(math.floor(y - radius), math.floor(y + radius) + 1):
+                    for entity in buckets.get((cellX, cellY), ()):
+                        if entity.collideCircle(x, y, radius):
+                            result.append(entity)
+        return result
     
     def getEntities(self):
         return self.statics + self.items + self.enemies + self.projectiles + [self.player]
     
     def getEntity(self, x, y, variation, area=0.5):
-        #Should never be used repeatedly, Inefficient.
-        result = None
+        #Finds the closest entity of a variation inside a circle, -1 checks every variation in order and then the player
+        for check in ((0, 1, 2, 3) if variation == -1 else (variation,)):
+            found = self.queryRadius(x, y, area, check)
+            if found:
+                return min(found, key=lambda entity: (entity.x - x) ** 2 + (entity.y - y) ** 2)
         
-        if variation == -1:
-            for sprite in self.getEntities():
-                if sprite.collideCircle(x, y, area):
-                    result = sprite
-                    break
-        else:
-            if variation == 0:
-                for static in self.statics:
-                    if static.collideCircle(x, y, area):
-                        result = static
-                        break
-            elif variation == 1:
-                for item in self.items:
-                    if item.collideCircle(x, y, area):
-                        result = item
-                        break
-            elif variation == 2:
-                for enemy in self.enemies:
-                    if enemy.collideCircle(x, y, area):
-                        result = enemy
-                        break
-            elif variation == 3:
-                for projectile in self.projectiles:
-                    if projectile.collideCircle(x, y, area):
-                        result = projectile
-                        break
+        if variation == -1 and self.player.collideCircle(x, y, area):
+            return self.player
         
-        return result
+        return None
+    
+    def useColumns(self):
+        '''
+        Moves enemies and projectiles into numpy arrays, after this they are updated all at once, see columns.Columns
+        Entities added later are stored in the arrays too, this cannot be undone
+        '''
+        if self.columns is None:
+            import columns
+            self.columns = columns.Columns()
+            for entity in self.enemies + self.projectiles:
+                self.columns.insert(entity)
+    
+    def remember(self):
+        #Remembers the position of everything that moves, must be called before the player and level are updated
+        self.player.remember()
+        
+        if self.columns is not None:
+            self.columns.remember()
+            return
+        
+        for enemy in self.enemies:
+            enemy.remember()
+        
+        for projectile in self.projectiles:
+            projectile.remember()
     
     def update(self, delta):
+        #Crowded levels switch to updating enemies and projectiles all at once
+        if self.columns is None and len(self.enemies) + len(self.projectiles) >= W_COLUMNTHRESHOLD:
+            self.useColumns()
+        
         self.player.update(delta)
         
         for item in self.items:
             item.update(delta)
         
-        for enemy in self.enemies:
+        if self.enemies:
+            self.updateFlow()
+        
+        if self.columns is not None:
+            self.columns.update(self, delta)
+            return
+        
+        #Entities remove themselves while updating, iterate over copies so none are skipped, like the columns
+        for enemy in list(self.enemies):
             enemy.update(delta)
         
-        for projectile in self.projectiles:
+        for projectile in list(self.projectiles):
             projectile.update(delta)
 
+#Neighbouring tiles used by the flow field, straight steps first
+FLOWOFFSETS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+
 class Entity(object):
+    #Slots keep entities small, there can be thousands of projectiles
+    __slots__ = ("x", "y", "direction", "level", "cell", "lastx", "lasty", "table", "row")
+    
     def __init__(self, x, y, direction):
         self.x = x
         self.y = y
         self.direction = direction
         self.level = None
         #Level is set by the level class, breaks if no level is attached
+        #Tile bucket the entity is stored in by the level's spatial index
+        self.cell = None
+        #Position before the last level update, used for interpolation
+        self.lastx = x
+        self.lasty = y
+        #Table and row that store the entity's fields when the level uses columns
+        self.table = None
+        self.row = None
+    
+    def remember(self):
+        #Stores the current position as the position before the next update
+        self.lastx = self.x
+        self.lasty = self.y
+    
+    def lerp(self, alpha):
+        '''
+        Finds the position between the last remembered position and the current position
+        alpha: 0 is the remembered position, 1 is the current position
+        '''
+        if alpha == 1:
+            return self.x, self.y
+        return self.lastx + (self.x - self.lastx) * alpha, self.lasty + (self.y - self.lasty) * alpha
     
     def collideCircle(self, x, y, size=0.5):
         '''
@@ -269,6 +623,9 @@ class Entity(object):
         else:
             self.x += deltaX
             self.y += deltaY
+        
+        if self.cell is not None:
+            self.level.relocateEntity(self)
     
     def walk(self, distance, collision=True):
         '''
@@ -292,11 +649,15 @@ class Entity(object):
         self.direction = (self.direction + degree) % 360
 
 class TexturedEntity(Entity):
+    __slots__ = ("texture",)
+    
     def __init__(self, x, y, direction, texture):
         super().__init__(x, y, direction)
         self.texture = texture
 
 class CharacterEntity(Entity):
+    __slots__ = ("speed", "maxhealth", "health", "dead", "cooldown", "cooldowntime", "projectilespeed", "projectiledamage", "projectiletexture")
+    
     def __init__(self, x, y, direction, speed, health, cooldown, projectilespeed, projectiledamage, projectiletexture):
         super().__init__(x, y, direction)
         self.speed = speed
@@ -325,9 +686,7 @@ class CharacterEntity(Entity):
     def shoot(self, level):
         if self.cooldowntime > self.cooldown:
             self.cooldowntime = 0
-            newProjectile = Projectile(self.x, self.y, self.direction, self.projectiletexture, self)
-            newProjectile.walk(1, False)
-            level.addEntity(newProjectile)
+            level.spawnProjectile(self.x, self.y, self.direction, self.projectiletexture, self)
 
 '''
 SPRITE VARIATIONS:
@@ -338,6 +697,7 @@ SPRITE VARIATIONS:
 '''
 
 class Player(CharacterEntity):
+    __slots__ = ("sprintspeed", "regen")
     variation = -1
     
     def __init__(self, x, y, direction, speed, sprintspeed, health, regen, cooldown, projectilespeed, projectiledamage, projectiletexture):
@@ -346,18 +706,40 @@ class Player(CharacterEntity):
         self.regen = regen
         self.cooldowntime = 0
     
+    def control(self, forward, strafe, turn, sprint, shooting, delta):
+        '''
+        Moves, rotates and shoots based on input
+        forward: 1 walks forward, -1 walks backward, 0 stands still
+        strafe: 1 strafes right, -1 strafes left, 0 stands still
+        turn: 1 rotates right, -1 rotates left, 0 does not rotate
+        sprint: Uses the sprint speed instead of the normal speed
+        shooting: Shoots a projectile if the cooldown is over
+        '''
+        speed = self.sprintspeed if sprint else self.speed
+        
+        if forward:
+            self.walk(forward * speed * delta)
+        if strafe:
+            self.strafe(strafe * speed * delta)
+        if turn:
+            self.rotate(turn * P_ROTATIONSPEED * delta)
+        if shooting:
+            self.shoot(self.level)
+    
     def update(self, delta):
         super().update(delta)
         if not self.dead:
             self.heal(self.regen * delta)
         
 class Static(TexturedEntity):
+    __slots__ = ()
     variation = 0
     
     def __init__(self, x, y, texture):
         super().__init__(x, y, 0, texture)
 
 class Item(TexturedEntity):
+    __slots__ = ("function",)
     variation = 1
     
     def __init__(self, x, y, texture, function):
@@ -374,6 +756,7 @@ class Item(TexturedEntity):
                 self.level.removeEntity(self)
 
 class Enemy(CharacterEntity):
+    __slots__ = ("texture",)
     variation = 2
     
     def __init__(self, x, y, direction, texture, speed, health, cooldown, projectilespeed, projectiledamage, projectiletexture):
@@ -387,18 +770,21 @@ class Enemy(CharacterEntity):
         if self.dead:
             self.level.removeEntity(self)
         
-        self.rotate(min(10, math.degrees(math.atan2(self.level.player.y - self.y, self.level.player.x - self.x)) - self.direction))
+        #Turns towards the way to the player, see Level.updateFlow()
+        self.rotate(min(10, self.level.getFlowAngle(self.x, self.y) - self.direction))
         
         if not self.collideCircle(self.level.player.x, self.level.player.y, 4) and self.collideCircle(self.level.player.x, self.level.player.y, 12):
             self.walk(self.speed * delta)
         
-        if self.cooldowntime > self.cooldown:
+        #Only shoots when the player can be seen, facing the player
+        player = self.level.player
+        if self.cooldowntime > self.cooldown and self.level.canSee(self.x, self.y, player.x, player.y):
             self.cooldowntime = 0
-            newProjectile = Projectile(self.x, self.y, self.direction, 2, self)
-            newProjectile.walk(1, False)
-            self.level.addEntity(newProjectile)
+            self.direction = math.degrees(math.atan2(player.y - self.y, player.x - self.x)) % 360
+            self.level.spawnProjectile(self.x, self.y, self.direction, self.projectiletexture, self)
 
 class Projectile(TexturedEntity):
+    __slots__ = ("spawn", "speed", "damage")
     variation = 3
     
     def __init__(self, x, y, direction, texture, spawn):
@@ -416,8 +802,8 @@ class Projectile(TexturedEntity):
             self.level.player.damage(self.damage)
             self.level.removeEntity(self)
         else:
-            for enemy in self.level.enemies:
-                if enemy != self.spawn and self.collideAABB(enemy.x, enemy.y):
+            for enemy in self.level.queryAABB(self.x, self.y, 0.5, 2):
+                if enemy != self.spawn:
                     enemy.damage(self.damage)
                     self.level.removeEntity(self)
                     break
\ No newline at end of file